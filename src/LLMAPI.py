@@ -4,6 +4,9 @@ from openai import OpenAI
 import json
 import logging
 
+from tracing import span
+from metrics import LLM_LATENCY, LLM_CALLS
+
 # 配置日志记录（可选，但推荐）
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,7 +14,8 @@ logger = logging.getLogger(__name__)
 # 初始化Ark客户端
 # 假设 API Key 已通过环境变量 ARK_API_KEY 设置
 # 注意：原始 URL 末尾有空格，已修正
-ARK_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+# 可通过环境变量 ARK_BASE_URL 指向本地模拟服务（见 benchmark.py）
+ARK_BASE_URL = os.environ.get("ARK_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
 ARK_API_KEY = os.environ.get("ARK_API_KEY")
 
 if not ARK_API_KEY:
@@ -34,40 +38,50 @@ def call_doubao_model(model_name, prompt_text):
         str or None: 返回模型的主要文本回复内容。如果调用失败，则返回 None。
                      注意：此函数返回的是原始文本，可能需要调用方进一步处理（如解析 JSON）。
     """
-    try:
-        logger.info(f"🤖 正在调用豆包模型 '{model_name}'...")
-        logger.debug(f"📝 发送的提示词: {prompt_text}")
+    with span("llm.call", model=model_name,
+              prompt_bytes=len(prompt_text.encode('utf-8'))) as s, LLM_LATENCY.time():
+        try:
+            logger.info(f"🤖 正在调用豆包模型 '{model_name}'...")
+            logger.debug(f"📝 发送的提示词: {prompt_text}")
 
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        # 注意：原始 image_url 末尾有空格，已修正
-                        # 如果需要发送图片，可以在这里添加 image_url 部分
-                        # {
-                        #     "type": "image_url",
-                        #     "image_url": {
-                        #         "url": "https://your-image-url.com/image.jpg"
-                        #     },
-                        # },
-                        {"type": "text", "text": prompt_text},
-                    ],
-                }
-            ],
-            # 可以根据需要添加其他参数，例如 temperature, max_tokens 等
-        )
+            response = client.chat.completions.create(
+                model=model_name,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            # 注意：原始 image_url 末尾有空格，已修正
+                            # 如果需要发送图片，可以在这里添加 image_url 部分
+                            # {
+                            #     "type": "image_url",
+                            #     "image_url": {
+                            #         "url": "https://your-image-url.com/image.jpg"
+                            #     },
+                            # },
+                            {"type": "text", "text": prompt_text},
+                        ],
+                    }
+                ],
+                # 可以根据需要添加其他参数，例如 temperature, max_tokens 等
+            )
 
-        # 提取主要的回复文本
-        reply_content = response.choices[0].message.content
-        logger.info("✅ 豆包模型调用成功。")
-        logger.debug(f"🤖 模型回复: {reply_content}")
-        return reply_content
+            # 提取主要的回复文本
+            reply_content = response.choices[0].message.content
+            s["reply_bytes"] = len((reply_content or "").encode('utf-8'))
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                s["prompt_tokens"] = usage.prompt_tokens
+                s["completion_tokens"] = usage.completion_tokens
+            LLM_CALLS.labels(status="ok").inc()
+            logger.info("✅ 豆包模型调用成功。")
+            logger.debug(f"🤖 模型回复: {reply_content}")
+            return reply_content
 
-    except Exception as e:
-        logger.error(f"❌ 调用豆包模型 '{model_name}' 时出错: {e}")
-        return None
+        except Exception as e:
+            s["error"] = str(e)
+            LLM_CALLS.labels(status="error").inc()
+            logger.error(f"❌ 调用豆包模型 '{model_name}' 时出错: {e}")
+            return None
 
 # # --- 示例用法 (如果直接运行此脚本) ---
 # if __name__ == "__main__":
@@ -0,0 +1,339 @@
+# src/benchmark.py
+"""
+离线性能测试：使用本地模拟服务（mock_servers.py）代替小小API和方舟接口，
+测量 generate_dictation_books 的端到端吞吐、各阶段耗时和内存峰值。
+
+内存按常驻内存（RSS）统计：python-docx 的表格保存在 lxml（libxml2）中，tracemalloc 看不到这部分内存。
+每个规模在独立的子进程中运行，峰值互不影响。
+
+用法示例：
+    python benchmark.py                          # 默认测 50 / 1000 / 10000 个单词
+    python benchmark.py --sizes 50 --llm-latency 0.8 --error-rate 0.05
+    python benchmark.py --mode replay --cassette-dir cassettes
+    python benchmark.py --output bench.json      # 保存结果
+    python benchmark.py --no-memory              # 在本进程中运行，不测量内存
+    python benchmark.py --compare-vision --sizes 10 20 40 --llm-latency 0.8 --llm-token-latency 0.005
+                                                 # 比较“识别 → 查释义”两步流程与识别时一并给出释义的流程
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import base64
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+import mock_servers
+
+DEFAULT_SIZES = (50, 1000, 10000)
+DEFAULT_VOCABULARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "word.txt")
+# 1x1 的 PNG：模拟视觉服务不看图片内容，只用它区分不同的图片
+TINY_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==")
+
+
+def build_word_list(size, vocabulary_file=DEFAULT_VOCABULARY):
+    """以 word.txt 为基础生成指定数量的单词（超出部分加数字后缀，保证互不相同）"""
+    with open(vocabulary_file, 'r', encoding='utf-8') as f:
+        base = [line.strip() for line in f if line.strip()]
+    if not base:
+        raise ValueError(f"词表 {vocabulary_file} 为空")
+    words = []
+    for i in range(size):
+        word = base[i % len(base)]
+        rounds = i // len(base)
+        words.append(word if rounds == 0 else f"{word}{rounds}")
+    return words
+
+
+def percentile(sorted_values, q):
+    """已排序列表的分位数（最近秩法）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def stage_stats(tracer):
+    """按 span 名称汇总：次数、总耗时、p50、p95、最大值（秒）；超出 max_spans 的 span 只计入次数、总耗时和最大值"""
+    durations = {}
+    for s in tracer.spans:
+        durations.setdefault(s["name"], []).append(s["dur"])
+    dropped = {}
+    for (name, _), (count, total, longest) in tracer.dropped.items():
+        entry = dropped.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += count
+        entry[1] += total
+        entry[2] = max(entry[2], longest)
+    stats = {}
+    for name in list(durations) + [name for name in dropped if name not in durations]:
+        values = sorted(durations.get(name, ()))
+        count, total, longest = dropped.get(name, (0, 0.0, 0.0))
+        stats[name] = {
+            "count": len(values) + count,
+            "total": round(sum(values) + total, 4),
+            "p50": round(percentile(values, 0.5), 4),
+            "p95": round(percentile(values, 0.95), 4),
+            "max": round(max(values[-1] if values else 0.0, longest), 4),
+        }
+    return stats
+
+
+def current_rss_bytes():
+    """本进程当前的常驻内存（字节）；没有 /proc 的平台返回 None"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    """本进程的常驻内存峰值（字节）；不支持 resource 模块的平台（Windows）返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux 上单位为 KiB
+
+
+def run_once(size, work_dir, vocabulary_file=DEFAULT_VOCABULARY, stream=False):
+    """在 work_dir 中对 size 个单词运行一次生成流程，返回结果字典"""
+    # 延迟导入：必须在设置好 XXAPI_URL / ARK_BASE_URL 之后再导入
+    from generateWord import generate_dictation_books
+    from tracing import start_job, finish_job
+    from lookup_router import LookupRouter
+    from meaning_cache import MeaningCache
+    from stream_pipeline import generate_dictation_books_streaming
+
+    words = build_word_list(size, vocabulary_file)
+    input_file = os.path.join(work_dir, "word.txt")
+    with open(input_file, 'w', encoding='utf-8') as f:
+        f.write("\n".join(words) + "\n")
+
+    # 每次运行使用全新的内存缓存，保证测到的是冷启动
+    router = LookupRouter(MeaningCache(":memory:"))
+    baseline_rss = current_rss_bytes()
+    cwd = os.getcwd()
+    os.chdir(work_dir)  # generate_dictation_books 把文档写到当前目录
+    try:
+        tracer = start_job(f"bench-{size}")
+        start = time.perf_counter()
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+            if stream:
+                success, message, _ = generate_dictation_books_streaming(input_file, router=router)
+            else:
+                success, message = generate_dictation_books(input_file, router=router)
+        elapsed = time.perf_counter() - start
+        trace_path, summary = finish_job(tracer, os.path.join(work_dir, "traces"))
+    finally:
+        os.chdir(cwd)
+        router.close()
+
+    return {
+        "words": size,
+        "stream": stream,
+        "success": success,
+        "message": message,
+        "seconds": round(elapsed, 4),
+        "words_per_second": round(size / elapsed, 2) if elapsed > 0 else None,
+        "baseline_rss_bytes": baseline_rss,
+        "peak_rss_bytes": None,
+        "stages": stage_stats(tracer),
+        "backend_wins": dict(router.wins),
+        "summary": summary,
+        "trace_file": trace_path,
+    }
+
+
+def _run_once_in_subprocess(env, size, work_dir, vocabulary_file, stream):
+    """（子进程）设置模拟服务地址后运行一次，并附上本进程的 RSS 峰值"""
+    os.environ.update(env)
+    import generateWord  # noqa: F401  LLMAPI 在导入时配置日志
+    logging.getLogger().setLevel(logging.WARNING)
+    result = run_once(size, work_dir, vocabulary_file, stream)
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def run_once_isolated(size, work_dir, vocabulary_file=DEFAULT_VOCABULARY, stream=False):
+    """在新的子进程中运行 run_once，使 RSS 峰值只反映这一次运行"""
+    env = {name: os.environ[name] for name in ("XXAPI_URL", "ARK_BASE_URL", "ARK_API_KEY") if name in os.environ}
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_run_once_in_subprocess, env, size, work_dir, vocabulary_file, stream).result()
+
+
+def trace_file_stats(trace_path):
+    """从任务的追踪文件中汇总模型调用次数和 token 数，以及小小API查询次数"""
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        events = json.load(f)["traceEvents"]
+    stats = {"model_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "xxapi_lookups": 0}
+    for event in events:
+        if event["name"] in ("vision.call", "llm.call"):
+            stats["model_calls"] += 1
+            stats["prompt_tokens"] += event["args"].get("prompt_tokens", 0)
+            stats["completion_tokens"] += event["args"].get("completion_tokens", 0)
+        elif event["name"] == "xxapi.lookup":
+            stats["xxapi_lookups"] += 1
+    stats["total_tokens"] = stats["prompt_tokens"] + stats["completion_tokens"]
+    return stats
+
+
+def run_image_once(size, work_dir, vision_meanings):
+    """对一张有 size 个方框单词的（模拟）练习页运行完整的图片任务，返回结果字典"""
+    from jobs import Job, run_job, JOB_IMAGE, STATUS_DONE
+    from lookup_router import LookupRouter
+    from meaning_cache import MeaningCache
+
+    image_path = os.path.join(work_dir, f"page-{size}.png")
+    with open(image_path, 'wb') as f:
+        f.write(TINY_PNG + str(size).encode())  # 不同大小的练习页使用不同的图片
+    output_dir = os.path.join(work_dir, "combined" if vision_meanings else "two-phase")
+
+    router = LookupRouter(MeaningCache(":memory:"))  # 冷启动
+    try:
+        start = time.perf_counter()
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+            job = run_job(Job(JOB_IMAGE, image_path, output_dir, vision_meanings=vision_meanings), router=router)
+        elapsed = time.perf_counter() - start
+    finally:
+        router.close()
+
+    result = {
+        "words": size,
+        "flow": "combined" if vision_meanings else "two-phase",
+        "success": job.status == STATUS_DONE,
+        "message": job.message,
+        "seconds": round(elapsed, 4),
+        "backend_wins": dict(router.wins),
+        "summary": job.trace_summary,
+        "trace_file": job.trace_file,
+    }
+    result.update(trace_file_stats(job.trace_file))
+    return result
+
+
+def print_vision_comparison(pairs):
+    print(f"   {'单词数':<8}{'流程':<12}{'耗时(s)':>10}{'模型调用':>10}{'输入token':>12}{'输出token':>12}"
+          f"{'总token':>10}{'小小API':>10}  释义来源")
+    for two_phase, combined in pairs:
+        for result in (two_phase, combined):
+            status = "" if result["success"] else "  ❌ " + result["message"]
+            wins = {source: count for source, count in result["backend_wins"].items() if count}
+            print(f"   {result['words']:<8}{result['flow']:<12}{result['seconds']:>10.2f}{result['model_calls']:>10}"
+                  f"{result['prompt_tokens']:>12}{result['completion_tokens']:>12}{result['total_tokens']:>10}"
+                  f"{result['xxapi_lookups']:>10}  {wins}{status}")
+        if two_phase["seconds"] > 0 and two_phase["total_tokens"] > 0:
+            print(f"   {'':<8}{'合并/两步':<12}{combined['seconds'] / two_phase['seconds']:>10.2f}"
+                  f"{'':>10}{'':>12}{'':>12}{combined['total_tokens'] / two_phase['total_tokens']:>10.2f}")
+
+
+def print_result(result):
+    peak, baseline = result["peak_rss_bytes"], result["baseline_rss_bytes"]
+    peak_text = f"{peak / 1024 / 1024:.1f} MiB" if peak is not None else "未测量"
+    if peak is not None and baseline is not None:
+        peak_text += f"（开始前 {baseline / 1024 / 1024:.1f} MiB）"
+    status = "✅" if result["success"] else "❌"
+    print(f"{status} {result['words']} 个单词：{result['seconds']:.2f}s，"
+          f"{result['words_per_second']} 词/秒，RSS 峰值 {peak_text}")
+    if not result["success"]:
+        print(f"   {result['message']}")
+    print(f"   释义来源：{result['backend_wins']}")
+    print(f"   {'阶段':<16}{'次数':>8}{'总耗时':>10}{'p50':>10}{'p95':>10}{'最大':>10}")
+    for name, stat in result["stages"].items():
+        print(f"   {name:<16}{stat['count']:>8}{stat['total']:>10.3f}"
+              f"{stat['p50']:>10.4f}{stat['p95']:>10.4f}{stat['max']:>10.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="使用本地模拟服务测量听写本生成流程的性能")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="单词数量列表")
+    parser.add_argument("--vocabulary", default=DEFAULT_VOCABULARY, help="生成测试词表所用的基础词表")
+    parser.add_argument("--mode", choices=mock_servers.MODES, default="mock",
+                        help="mock：模拟响应；record：转发真实服务并录制；replay：回放录制结果")
+    parser.add_argument("--cassette-dir", default="cassettes", help="record/replay 模式的录制文件目录")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="模拟大模型的基础延迟（秒）")
+    parser.add_argument("--xxapi-latency", type=float, default=0.0, help="模拟小小API的基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机抖动上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务返回 500 的概率")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="大模型回复被截断的概率")
+    parser.add_argument("--miss-rate", type=float, default=0.1, help="小小API未找到单词的比例")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0,
+                        help="模拟大模型每个输出 token 的生成时间（秒）")
+    parser.add_argument("--compare-vision", action="store_true",
+                        help="比较图片任务的两步流程与识别时一并给出释义的流程（--sizes 为练习页上的单词数）")
+    parser.add_argument("--vision-invalid-rate", type=float, default=0.1,
+                        help="合并模式下视觉模型给出无效释义的比例（这些单词改为逐词查询）")
+    parser.add_argument("--stream", action="store_true", help="使用流式分部分生成（stream_pipeline.py）")
+    parser.add_argument("--no-memory", action="store_true", help="在本进程中运行，不测量 RSS 峰值（便于调试）")
+    parser.add_argument("--keep", action="store_true", help="保留生成的文档和追踪文件")
+    parser.add_argument("--output", help="将结果以 JSON 格式写入该文件")
+    args = parser.parse_args(argv)
+
+    cassette = (lambda name: os.path.join(args.cassette_dir, name)) if args.mode != "mock" else (lambda name: None)
+    xxapi_config = mock_servers.MockConfig(latency=args.xxapi_latency, jitter=args.jitter,
+                                           error_rate=args.error_rate, miss_rate=args.miss_rate)
+    ark_config = mock_servers.MockConfig(latency=args.llm_latency, jitter=args.jitter,
+                                         error_rate=args.error_rate, truncate_rate=args.truncate_rate,
+                                         vision_invalid_rate=args.vision_invalid_rate,
+                                         token_latency=args.llm_token_latency)
+    xxapi_server, xxapi_url = mock_servers.start_xxapi(xxapi_config, args.mode, cassette("xxapi.jsonl"))
+    ark_server, ark_url = mock_servers.start_ark(ark_config, args.mode, cassette("ark.jsonl"))
+
+    # 必须在导入 LLMAPI / generateWord 之前设置
+    os.environ["XXAPI_URL"] = xxapi_url
+    os.environ["ARK_BASE_URL"] = ark_url
+    if args.mode != "record":  # 只有录制时才需要真实的 API Key
+        os.environ.setdefault("ARK_API_KEY", "benchmark-dummy-key")
+    import generateWord  # noqa: F401  LLMAPI 在导入时配置日志并创建客户端
+    logging.getLogger().setLevel(logging.WARNING)  # 屏蔽每次请求的 INFO 日志
+
+    print(f"🧪 模拟服务（{args.mode} 模式）：XXAPI_URL={xxapi_url}  ARK_BASE_URL={ark_url}")
+    results = []
+    try:
+        if args.compare_vision:
+            pairs = []
+            for size in args.sizes:
+                ark_config.vision_words = size
+                work_dir = tempfile.mkdtemp(prefix=f"bench-vision-{size}-")
+                try:
+                    pair = (run_image_once(size, work_dir, False), run_image_once(size, work_dir, True))
+                finally:
+                    if not args.keep:
+                        shutil.rmtree(work_dir, ignore_errors=True)
+                for result in pair:
+                    result["work_dir"] = work_dir if args.keep else None
+                results.extend(pair)
+                pairs.append(pair)
+            print_vision_comparison(pairs)
+        for size in ([] if args.compare_vision else args.sizes):
+            work_dir = tempfile.mkdtemp(prefix=f"bench-{size}-")
+            try:
+                run = run_once if args.no_memory else run_once_isolated
+                result = run(size, work_dir, args.vocabulary, args.stream)
+                result["work_dir"] = work_dir if args.keep else None
+                results.append(result)
+                print_result(result)
+            finally:
+                if not args.keep:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        xxapi_server.stop()
+        ark_server.stop()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"mode": args.mode, "args": vars(args), "results": results}, f,
+                      ensure_ascii=False, indent=2)
+        print(f"📄 结果已保存到 {os.path.abspath(args.output)}")
+    return 0 if all(result["success"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+# src/entries.py
+"""
+词条的结构化表示，取代原来把“未找到释义”“请求失败：...”等状态文字当作释义存放的做法。
+
+每个词条记录明确的状态、来源和解析好的（词性, 释义）列表；
+EntryStore 维护待查询单词的索引，查询流程不再需要扫描整张列表比对字符串。
+"""
+import re
+
+# 词条状态
+STATUS_PENDING = 0     # 尚未得到结果
+STATUS_RESOLVED = 1    # 已获得释义
+STATUS_NOT_FOUND = 2   # 各个来源都没有给出释义
+STATUS_FAILED = 3      # 请求出错
+
+STATUS_NAMES = {
+    STATUS_PENDING: "pending",
+    STATUS_RESOLVED: "resolved",
+    STATUS_NOT_FOUND: "not_found",
+    STATUS_FAILED: "failed",
+}
+
+# 释义来源
+SOURCE_NONE = ""
+SOURCE_CACHE = "cache"
+SOURCE_XXAPI = "xxapi"
+SOURCE_LLM = "llm"
+SOURCE_VISION = "vision"   # 识别图片时由视觉模型一并给出
+
+_SENSE_LINE = re.compile(r'^([a-zA-Z]+)\.\s*(.*)$')
+
+
+def parse_meaning(text):
+    """
+    把“词性. 释义”格式的多行文字解析为 ((pos, gloss), ...)。
+    没有词性前缀的行记为 ("", 整行)。
+    """
+    senses = []
+    for line in (text or "").split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        match = _SENSE_LINE.match(line)
+        if match:
+            senses.append((match.group(1), match.group(2).strip()))
+        else:
+            senses.append(("", line))
+    return tuple(senses)
+
+
+def senses_from_translations(data, require_pos=False):
+    """
+    把 {"translations": [{"word": ..., "meaning": ...}, ...]} 转换为 {word: ((pos, gloss), ...)}。
+    没有释义的条目被忽略；require_pos 为 True 时，有任何一行缺少词性的条目也被忽略。
+    """
+    translations = data.get("translations", []) if isinstance(data, dict) else []
+    result = {}
+    for item in translations:
+        if not (isinstance(item, dict) and item.get("word") and item.get("meaning")):
+            continue
+        senses = parse_meaning(str(item["meaning"]))
+        if not senses or (require_pos and not all(pos for pos, _ in senses)):
+            continue
+        result[str(item["word"]).strip()] = senses
+    return result
+
+
+def format_sense(pos, gloss):
+    return f"{pos}. {gloss}" if pos else gloss
+
+
+def format_senses(senses):
+    """parse_meaning 的逆操作"""
+    return "\n".join(format_sense(pos, gloss) for pos, gloss in senses)
+
+
+class Entry:
+    """一个词条；使用 __slots__ 以减少大词库的内存占用"""
+    __slots__ = ("word", "status", "source", "senses", "error")
+
+    def __init__(self, word, status=STATUS_PENDING, source=SOURCE_NONE, senses=(), error=None):
+        self.word = word
+        self.status = status
+        self.source = source
+        self.senses = senses    # ((pos, gloss), ...)
+        self.error = error      # 仅用于日志，不会写入文档
+
+    @property
+    def resolved(self):
+        return self.status == STATUS_RESOLVED
+
+    def __repr__(self):
+        return (f"Entry({self.word!r}, {STATUS_NAMES[self.status]}, source={self.source!r}, "
+                f"senses={self.senses!r})")
+
+
+class EntryStore:
+    """按单词去重的词条集合，并维护待查询单词的索引"""
+
+    def __init__(self, words=()):
+        self._entries = {}     # word -> Entry（保持插入顺序）
+        self._pending = {}     # 仍待查询的单词（dict 用作有序集合）
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        entry = self._entries.get(word)
+        if entry is None:
+            entry = Entry(word)
+            self._entries[word] = entry
+            self._pending[word] = None
+        return entry
+
+    def __getitem__(self, word):
+        return self._entries[word]
+
+    def get(self, word):
+        return self._entries.get(word)
+
+    def __contains__(self, word):
+        return word in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def is_pending(self, word):
+        return word in self._pending
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    def pending_words(self):
+        return list(self._pending)
+
+    def resolve(self, word, senses, source):
+        """记录释义；单词已有结果时忽略并返回 False（先到者为准）"""
+        if word not in self._pending:
+            return False
+        entry = self._entries[word]
+        entry.status = STATUS_RESOLVED
+        entry.source = source
+        entry.senses = tuple(senses)
+        del self._pending[word]
+        return True
+
+    def fail(self, word, status=STATUS_NOT_FOUND, source=SOURCE_NONE, error=None):
+        """记录查询失败（STATUS_NOT_FOUND 或 STATUS_FAILED）"""
+        if word not in self._pending:
+            return False
+        entry = self._entries[word]
+        entry.status = status
+        entry.source = source
+        entry.error = error
+        del self._pending[word]
+        return True
+
+    def counts(self):
+        """各状态的词条数，例如 {"resolved": 18, "not_found": 2}"""
+        result = {}
+        for entry in self._entries.values():
+            name = STATUS_NAMES[entry.status]
+            result[name] = result.get(name, 0) + 1
+        return result
+
+    def source_counts(self):
+        result = {}
+        for entry in self._entries.values():
+            if entry.resolved:
+                result[entry.source] = result.get(entry.source, 0) + 1
+        return result
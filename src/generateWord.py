@@ -5,32 +5,58 @@ from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.shared import Pt, Cm
 import os
-import re
 import json # 需要导入 json
 
 from LLMAPI import call_doubao_model # 假设 generateWord.py 也在 src 目录下
+from tracing import span
+from entries import STATUS_RESOLVED, STATUS_NOT_FOUND, STATUS_FAILED, format_sense
+from metrics import XXAPI_LATENCY, XXAPI_LOOKUPS, LLM_JSON_PARSE_FAILURES
 # API配置
-API_URL = "https://v2.xxapi.cn/api/englishwords"
+API_URL = os.environ.get("XXAPI_URL", "https://v2.xxapi.cn/api/englishwords")
 HEADERS = {
     'User-Agent': 'xiaoxiaoapi/1.0.0 (https://xxapi.cn)'
 }
+XXAPI_TIMEOUT = 10  # 小小API请求超时（秒），避免接口卡住时整个流程无限等待
+# 输出文档的文件名
+MEANING_DOC_NAME = '单词听写本（带词意）.docx'
+BLANK_DOC_NAME = '单词听写本（无词意）.docx'
+# 词条数达到该值、且至少有两个 CPU 核时使用多进程分片渲染（见 parallel_render.py）；
+# 单核机器上进程池只有额外开销
+PARALLEL_RENDER_THRESHOLD = 2000
+PARALLEL_RENDER_MIN_CPUS = 2
+# generate_dictation_books 进度回调的阶段
+PROGRESS_LOOKUP = "lookup"
+PROGRESS_BATCH = "batch"
+PROGRESS_RENDER = "render"
 # --- 豆包模型配置 ---
 DOUBAO_MODEL_NAME = "doubao-seed-1-6-flash-250615" # 请替换为你的实际模型ID
+# 释义 JSON 的格式要求；视觉模型同时返回释义时（image_analyzer.analyze_image_with_meanings）使用同一格式
+TRANSLATIONS_JSON_PROMPT = (
+    "只返回一个有效的 JSON 对象，结构为 {\"translations\": [{\"word\": \"...\", \"meaning\": \"...\\n...\"}, ...]}。"
+    "'meaning' 字段内，每个释义项用 '\\n' 分隔，格式为 '词性（用n、adj、v等这种常用英文字母表示的方式表达）. 释义'。"
+)
 
 # --- 豆包模型调用 ---
 def call_large_model_api(words_batch):
     """
     调用豆包大模型 API 来批量翻译单词。
     """
+    with span("llm.batch", batch_size=len(words_batch)) as s:
+        result = _call_large_model_api(words_batch)
+        s["returned"] = len(result.get("translations", []))
+        return result
+
+
+def _call_large_model_api(words_batch):
+    """call_large_model_api 的实际实现（不含追踪）"""
     print(f"🤖 正在调用豆包模型翻译 {len(words_batch)} 个单词...")
 
     # --- 构造提示词 ---
     prompt = (
         "请为以下英文单词或短语提供中文释义。"
-        "要求：1. 只返回一个有效的 JSON 对象，结构为 {\"translations\": [{\"word\": \"...\", \"meaning\": \"...\\n...\"}, ...]}。"
-        "2. 'meaning' 字段内，每个释义项用 '\\n' 分隔，格式为 '词性（用n、adj、v等这种常用英文字母表示的方式表达）. 释义'。"
-        "3. 不要包含任何其他解释、说明或 Markdown。"
-        "4. 严格按照提供的单词列表顺序返回。"
+        "要求：1. " + TRANSLATIONS_JSON_PROMPT +
+        "2. 不要包含任何其他解释、说明或 Markdown。"
+        "3. 严格按照提供的单词列表顺序返回。"
         "单词列表: "
         + ", ".join([f'"{word}"' for word in words_batch])
     )
@@ -46,109 +72,130 @@ def call_large_model_api(words_batch):
 
     # --- 尝试解析返回的 JSON ---
     try:
-        # 大模型有时会在 JSON 前后加上 ```json ``` 标记，需要移除
-        cleaned_text = raw_response_text.strip()
-        if cleaned_text.startswith("```json"):
-            cleaned_text = cleaned_text[7:] # 移除 ```json
-        if cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[:-3] # 移除 ```
-
-        model_data = json.loads(cleaned_text)
+        model_data = parse_model_json(raw_response_text)
         print(f"🤖 大模型成功解析 JSON: {json.dumps(model_data, indent=2, ensure_ascii=False)}") # 仅用于调试
         return model_data
     except json.JSONDecodeError as e:
+        LLM_JSON_PARSE_FAILURES.inc()
         print(f"❌ 无法将大模型的回复解析为 JSON: {e}")
         print(f"🤖 大模型的原始回复是: {raw_response_text}")
         # 返回一个空的或错误的结构
         return {"translations": []}
+
+
+def parse_model_json(raw_text):
+    """解析大模型回复中的 JSON，失败时抛出 json.JSONDecodeError"""
+    # 大模型有时会在 JSON 前后加上 ```json ``` 标记，需要移除
+    cleaned_text = raw_text.strip()
+    if cleaned_text.startswith("```json"):
+        cleaned_text = cleaned_text[7:] # 移除 ```json
+    if cleaned_text.endswith("```"):
+        cleaned_text = cleaned_text[:-3] # 移除 ```
+    return json.loads(cleaned_text)
 # --- 替换或修改结束 ---
 
 
 
 
 
-def get_word_details(word):
-    """调用小小API获取单词详细信息"""
+def fetch_word_senses(word):
+    """
+    调用小小API查询单词，返回结构化结果。
+
+    Returns:
+        tuple: (状态, ((词性, 释义), ...), 错误信息)，状态为 entries 中的 STATUS_* 常量
+    """
+    with span("xxapi.lookup", word=word) as s:
+        with XXAPI_LATENCY.time():
+            status, senses, error = _fetch_word_senses(word)
+        s["result"] = {STATUS_RESOLVED: "hit", STATUS_NOT_FOUND: "miss"}.get(status, "error")
+        XXAPI_LOOKUPS.labels(result=s["result"]).inc()
+        return status, senses, error
+
+
+def _fetch_word_senses(word):
+    """fetch_word_senses 的实际实现（不含追踪）"""
     try:
         # 注意：原代码 URL 和 Headers 末尾有空格，已修正
-        response = requests.get(f"{API_URL}?word={word}", headers=HEADERS)
+        response = requests.get(f"{API_URL}?word={word}", headers=HEADERS, timeout=XXAPI_TIMEOUT)
         response.raise_for_status() # 更好的错误处理
         data = response.json()
 
         if data.get("code") == 200: # 使用 .get() 更安全
             translations = data["data"]["translations"]
-            result = []
-
-            for trans in translations:
-                pos = trans["pos"]
-                tran_cn = trans["tran_cn"].strip()
-                result.append(f"{pos}. {tran_cn}")
-
-            return "\n".join(result) # 返回格式化后的字符串
+            senses = tuple((trans["pos"], trans["tran_cn"].strip()) for trans in translations)
+            if senses:
+                return STATUS_RESOLVED, senses, None
+            # 查到了单词但没有释义：按未找到处理，交给大模型
+            print(f"⚠️ 小小API返回的 '{word}' 没有释义")
+            return STATUS_NOT_FOUND, (), None
 
         else:
             print(f"⚠️ 小小API未找到 '{word}' 的释义 (Code: {data.get('code')})")
-            return "未找到释义"
+            return STATUS_NOT_FOUND, (), None
     except requests.exceptions.RequestException as e: # 更具体的异常处理
         print(f"❌ 小小API请求失败 '{word}': {e}")
-        return f"请求失败：{e}"
-    except (KeyError, json.JSONDecodeError) as e: # 处理 JSON 解析或键不存在错误
+        return STATUS_FAILED, (), str(e)
+    except (KeyError, TypeError, json.JSONDecodeError) as e: # 处理 JSON 解析或键不存在错误
         print(f"❌ 小小API响应格式错误 '{word}': {e}")
-        return "请求失败：响应格式错误"
+        return STATUS_FAILED, (), "响应格式错误"
+
 
 # --- 修改：generate_dictation_books 主函数 ---
-def generate_dictation_books(input_file='word.txt'):
-    """生成听写本的主函数"""
+def generate_dictation_books(input_file='word.txt', output_dir=None, router=None, progress=None,
+                             known_senses=None):
+    """
+    生成听写本的主函数
+
+    Args:
+        input_file (str): 单词列表文件，每行一个单词或短语。
+        output_dir (str, optional): 文档输出目录，默认为当前目录。
+        router (LookupRouter, optional): 释义查询路由，默认使用进程内共享的路由器。
+        progress (callable, optional): progress(阶段, 已完成, 总数)，阶段为
+            PROGRESS_LOOKUP（已查到释义的单词）、PROGRESS_BATCH（大模型批次）
+            或 PROGRESS_RENDER（已生成的文档）；可能在其他线程中被调用。
+        known_senses (dict, optional): {word: ((pos, gloss), ...)}，识别图片时已经得到的释义，
+            这些单词不再查询（见 image_analyzer.analyze_image_with_meanings）。
+    """
+    report = progress or (lambda stage, done, total: None)
     try:
         words = read_words_from_file(input_file)
         if not words:
             return False, "没有找到单词数据"
 
-        words_with_details = []
-        words_for_llm = [] # 存储需要大模型翻译的单词
-
-        # 第一步：调用小小API获取释义
-        for word in words:
-            meaning = get_word_details(word)
-            if meaning == "未找到释义":
-                words_for_llm.append(word)
-                # 先存个占位符，后续用大模型结果替换
-                words_with_details.append((word, "待大模型翻译..."))
-            else:
-                words_with_details.append((word, meaning))
-
-        # 第二步：批量调用大模型处理失败的单词
-        BATCH_SIZE = 20
-        llm_results_dict = {} # 用字典存储结果，方便后续查找 {word: meaning}
-
-        for i in range(0, len(words_for_llm), BATCH_SIZE):
-            batch = words_for_llm[i:i + BATCH_SIZE]
+        # 第一步：通过查询路由获取释义（本地缓存 → 小小API → 大模型，
+        # 小小API过慢时对冲、不可用时熔断，详见 lookup_router.py）
+        if router is None:
+            from lookup_router import get_default_router  # 延迟导入，避免循环依赖
+            router = get_default_router()
+        store = router.resolve(
+            words,
+            progress=lambda done, total: report(PROGRESS_LOOKUP, done, total),
+            batch_progress=lambda done, total: report(PROGRESS_BATCH, done, total),
+            known=known_senses)
+        entries = [store[word] for word in words]
+
+        # 第二步：生成Word文档
+        output_dir = output_dir or ''
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        rendered = False
+        report(PROGRESS_RENDER, 0, 2)
+        if len(entries) >= PARALLEL_RENDER_THRESHOLD and (os.cpu_count() or 1) >= PARALLEL_RENDER_MIN_CPUS:
             try:
-                llm_response_data = call_large_model_api(batch)
-                # 解析大模型返回的 JSON
-                if "translations" in llm_response_data:
-                    for item in llm_response_data["translations"]:
-                        llm_results_dict[item["word"]] = item["meaning"]
-                else:
-                     print(f"⚠️ 大模型返回数据格式不正确 (缺少 'translations' 键): {llm_response_data}")
+                from parallel_render import render_dictation_books_parallel
+                render_dictation_books_parallel(entries, output_dir)
+                success1 = success2 = rendered = True
             except Exception as e:
-                 print(f"❌ 调用大模型或解析其响应时出错: {e}")
-                 # 可以选择为这批单词设置一个默认错误信息
-                 for word in batch:
-                     llm_results_dict[word] = f"大模型翻译失败: {e}"
-
-        # 第三步：将大模型的结果整合回 words_with_details
-        for i, (word, meaning) in enumerate(words_with_details):
-             if meaning == "待大模型翻译...":
-                 # 用大模型的结果替换占位符
-                 words_with_details[i] = (word, llm_results_dict.get(word, "大模型未返回释义"))
-
-        # 第四步：生成Word文档
-        success1 = create_word_doc(words_with_details, '单词听写本（带词意）.docx')
-        success2 = create_blank_word_doc(words_with_details, '单词听写本（无词意）.docx')
+                print(f"⚠️ 多进程渲染失败，改为单进程渲染：{e}")
+        if not rendered:
+            success1 = create_word_doc(entries, os.path.join(output_dir, MEANING_DOC_NAME))
+            report(PROGRESS_RENDER, 1, 2)
+            success2 = create_blank_word_doc(entries, os.path.join(output_dir, BLANK_DOC_NAME))
+        report(PROGRESS_RENDER, 2, 2)
 
         if success1 and success2:
-            return True, "听写本生成成功！已创建两个文件：单词听写本（带词意）.docx 和 单词听写本（无词意）.docx"
+            return True, "听写本生成成功！已创建两个文件：单词听写本（带词意）.docx 和 单词听写本（无词意）.docx" + unresolved_note(store)
         else:
             return False, "部分文件生成失败"
 
@@ -159,11 +206,20 @@ def generate_dictation_books(input_file='word.txt'):
 
 # --- 其他函数 (read_words_from_file, create_word_doc, create_blank_word_doc) 保持不变 ---
 # (为了完整性，这里也包含它们，但实际使用时不需要重复)
+def iter_words_from_file(filename='word.txt'):
+    """逐行读取txt中的单词（生成器，不会把整个文件读入内存）"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            word = line.strip()
+            if word:
+                yield word
+
 def read_words_from_file(filename='word.txt'):
     """读取txt中的单词"""
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            words = [line.strip() for line in f.readlines() if line.strip()]
+        with span("words.read", file=os.path.basename(filename)) as s:
+            words = list(iter_words_from_file(filename))
+            s["word_count"] = len(words)
         return words
     except FileNotFoundError:
         print(f"❌ 文件 {filename} 不存在")
@@ -172,80 +228,97 @@ def read_words_from_file(filename='word.txt'):
         print(f"❌ 读取文件失败：{e}")
         return []
 
-def create_word_doc(words_with_details, output_filename='单词听写本（带词意）.docx'):
-    """创建带词意的听写本word"""
-    try:
-        doc = Document()
-        section = doc.sections[0]
-        sect_pr = section._sectPr
-        cols = OxmlElement('w:cols')
-        cols.set(qn('w:num'), '2')
-        cols.set(qn('w:space'), '720')
-        for child in list(sect_pr):
-            if child.tag == qn('w:cols'):
-                sect_pr.remove(child)
-        sect_pr.append(cols)
-        table = doc.add_table(rows=0, cols=2)
-        for word, detail in words_with_details:
-            row = table.add_row()
-            cells = row.cells
-            cells[0].text = word
-            cells[1].text = ''
-            paragraph = cells[1].paragraphs[0]
-            paragraph.paragraph_format.space_after = Pt(0)
-            lines = detail.split('\n')
-            for i, line in enumerate(lines):
-                run = paragraph.add_run(line.strip())
-                run.bold = False
-                run.font.name = '宋体'
-                run._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
-                run.font.size = Pt(9)
-                if i < len(lines) - 1:
-                    run.add_break()
-            run.underline = WD_UNDERLINE.SINGLE
-            cells[0].width = 12800
+def new_dictation_document():
+    """创建双栏排版的空听写本文档，返回 (doc, table)"""
+    doc = Document()
+    section = doc.sections[0]
+    sect_pr = section._sectPr
+    cols = OxmlElement('w:cols')
+    cols.set(qn('w:num'), '2')
+    cols.set(qn('w:space'), '720')
+    for child in list(sect_pr):
+        if child.tag == qn('w:cols'):
+            sect_pr.remove(child)
+    sect_pr.append(cols)
+    table = doc.add_table(rows=0, cols=2)
+    return doc, table
+
+def add_meaning_row(table, entry):
+    """在带词意的听写本表格中添加一行；没有释义的词条留空，不写入错误信息"""
+    row = table.add_row()
+    cells = row.cells
+    cells[0].text = entry.word
+    cells[1].text = ''
+    paragraph = cells[1].paragraphs[0]
+    paragraph.paragraph_format.space_after = Pt(0)
+    lines = [format_sense(pos, gloss) for pos, gloss in entry.senses] if entry.resolved else []
+    lines = lines or ['']  # 至少写入一个 run，空单元格也带下划线格式
+    for i, line in enumerate(lines):
+        run = paragraph.add_run(line)
+        run.bold = False
+        run.font.name = '宋体'
+        run._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
+        run.font.size = Pt(9)
+        if i < len(lines) - 1:
+            run.add_break()
+    run.underline = WD_UNDERLINE.SINGLE
+    cells[0].width = 12800
+
+def add_blank_row(table, entry):
+    """在无词意的听写本表格中添加一行（只保留词性）"""
+    row = table.add_row()
+    cells = row.cells
+    cells[0].text = entry.word
+    cells[1].text = ''
+    paragraph = cells[1].paragraphs[0]
+    paragraph.paragraph_format.space_after = Pt(0)
+    senses = entry.senses if entry.resolved else ()
+    for i, (pos, _) in enumerate(senses):
+        if pos:
+            run = paragraph.add_run(f"{pos}.")
+            run.font.name = '宋体'
+            run._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
+            run.font.size = Pt(9)
+            if i < len(senses) - 1:
+                run.add_break()
+    cells[0].width = 12800
+
+def unresolved_note(store, limit=10):
+    """生成“未获取到释义”的提示文字，全部成功时返回空字符串"""
+    missing = [entry.word for entry in store if not entry.resolved]
+    if not missing:
+        return ""
+    shown = "、".join(missing[:limit]) + ("等" if len(missing) > limit else "")
+    return f"\n其中 {len(missing)} 个词条未获取到释义（已留空）：{shown}"
+
+def save_document(doc, output_filename, kind):
+    """保存文档并记录耗时"""
+    with span("docx.save", doc=kind) as s:
         doc.save(output_filename)
-        print(f"✅ 已保存为 {os.path.abspath(output_filename)}")
+        s["file_bytes"] = os.path.getsize(output_filename)
+    print(f"✅ 已保存为 {os.path.abspath(output_filename)}")
+
+def create_word_doc(entries, output_filename='单词听写本（带词意）.docx'):
+    """创建带词意的听写本word（entries 为 entries.Entry 列表）"""
+    try:
+        with span("docx.build", doc="带词意", rows=len(entries)):
+            doc, table = new_dictation_document()
+            for entry in entries:
+                add_meaning_row(table, entry)
+        save_document(doc, output_filename, "带词意")
         return True
     except Exception as e:
         print(f"❌ 生成带词意文档失败：{e}")
         return False
 
-def create_blank_word_doc(words_with_details, output_filename='单词听写本（无词意）.docx'):
+def create_blank_word_doc(entries, output_filename='单词听写本（无词意）.docx'):
     """创建不带词意的听写本word（供默写）"""
     try:
-        doc = Document()
-        section = doc.sections[0]
-        sect_pr = section._sectPr
-        cols = OxmlElement('w:cols')
-        cols.set(qn('w:num'), '2')
-        cols.set(qn('w:space'), '720')
-        for child in list(sect_pr):
-            if child.tag == qn('w:cols'):
-                sect_pr.remove(child)
-        sect_pr.append(cols)
-        table = doc.add_table(rows=0, cols=2)
-        for word, detail in words_with_details:
-            row = table.add_row()
-            cells = row.cells
-            cells[0].text = word
-            cells[1].text = ''
-            paragraph = cells[1].paragraphs[0]
-            paragraph.paragraph_format.space_after = Pt(0)
-            lines = detail.split('\n')
-            for i, line in enumerate(lines):
-                match = re.match(r'^([a-zA-Z]+\.).*', line.strip())
-                if match:
-                    pos = match.group(1)
-                    run = paragraph.add_run(pos)
-                    run.font.name = '宋体'
-                    run._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
-                    run.font.size = Pt(9)
-                    if i < len(lines) - 1:
-                        run.add_break()
-            cells[0].width = 12800
-        doc.save(output_filename)
-        print(f"✅ 已保存为 {os.path.abspath(output_filename)}")
+        with span("docx.build", doc="无词意", rows=len(entries)):
+            doc, table = new_dictation_document()
+            for entry in entries:
+                add_blank_row(table, entry)
+        save_document(doc, output_filename, "无词意")
         return True
     except Exception as e:
         print(f"❌ 生成无词意文档失败：{e}")
@@ -3,14 +3,22 @@ import os
 import base64
 from openai import OpenAI
 
+from tracing import span
+from metrics import VISION_LATENCY, LLM_JSON_PARSE_FAILURES, mark_vision_call
+
 # 支持的图像格式
 SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.png')
 
 
 def encode_image_to_base64(image_path):
     """将本地图片编码为 base64 字符串"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    with span("image.encode") as s:
+        with open(image_path, "rb") as image_file:
+            raw = image_file.read()
+        encoded = base64.b64encode(raw).decode('utf-8')
+        s["image_bytes"] = len(raw)
+        s["payload_bytes"] = len(encoded)
+        return encoded
 
 
 def is_image_file(file_path):
@@ -18,60 +26,123 @@ def is_image_file(file_path):
     return os.path.isfile(file_path) and file_path.lower().endswith(SUPPORTED_FORMATS)
 
 
+VISION_MODEL_NAME = "doubao-1.5-vision-lite-250315"  # doubao-1.5-vision-lite-250315，doubao-seed-1-6-flash-250715（有点垃圾）
+
+WORDS_PROMPT = (
+    "返回被方框框起来的单词和短语，用逗号分隔"
+    # "返回格式要求：返回的单词都用单数、第一人称而且是现在时态，不能用复数、第三人称或者过去式，用逗号分隔"
+    # "这篇文章中有一些英文单词或短语被方框框住了。请你按照以下要求处理这些被框起来的内容："
+    # "要求："
+    # "1.列出所有被方框框起来的英文单词或短语。"
+    # "2.筛选符合以下标准的短语："
+    # "核心特征：该短语由 2 个及以上单词组成，但其整体语义无法通过组成单词的字面意思直接组合推导，属于固定搭配、习语、成语或具有特殊引申义的表达（即 “语义不可拆分”）。"
+    # "排除标准：若短语的语义可由组成单词的字面意思简单叠加得出（如 “generally speaking”=“generally（一般地）+ speaking（说）”→“一般来说”），无特殊引申义，则排除此类短语。"
+    # "3.对于不符合上述标准的短语，返回其中一个词义比较重要的单词。"
+    # "返回要求：以逗号分隔的形式返回，"
+    # "返回示例：apple, banana, cat,take on"
+)
+
+
+def _call_vision_model(image_path, prompt, mode):
+    """把图片和提示词发给视觉模型，返回回复文字；出错时抛出异常"""
+    # 将图片转为 base64
+    base64_image = encode_image_to_base64(image_path)
+
+    # 初始化客户端
+    client = OpenAI(
+        base_url=os.environ.get("ARK_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3"),  # 去掉多余空格
+        api_key=os.environ.get("ARK_API_KEY"),
+    )
+
+    with span("vision.call", model=VISION_MODEL_NAME, mode=mode,
+              payload_bytes=len(base64_image)) as vs, VISION_LATENCY.time():
+        try:
+            response = client.chat.completions.create(
+                model=VISION_MODEL_NAME,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    # 修正：添加完整的 data: 前缀
+                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                },
+                            },
+                            {"type": "text", "text": prompt},
+                        ],
+                    }
+                ],
+            )
+        except Exception:
+            mark_vision_call("error")
+            raise
+        mark_vision_call("ok")
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            vs["prompt_tokens"] = usage.prompt_tokens
+            vs["completion_tokens"] = usage.completion_tokens
+
+    return response.choices[0].message.content.strip()
+
+
 def analyze_image(image_path):
     """分析图像并返回识别结果"""
     try:
         if not is_image_file(image_path):
             return "错误：请提供一个有效的图像文件（jpg/png）"
+        return _call_vision_model(image_path, WORDS_PROMPT, "words")
 
-        # 将图片转为 base64
-        base64_image = encode_image_to_base64(image_path)
+    except Exception as e:
+        return f"分析失败：{str(e)}"
 
-        # 初始化客户端
-        client = OpenAI(
-            base_url="https://ark.cn-beijing.volces.com/api/v3",  # 去掉多余空格
-            api_key=os.environ.get("ARK_API_KEY"),
-        )
 
-        response = client.chat.completions.create(
-            model="doubao-1.5-vision-lite-250315",  # doubao-1.5-vision-lite-250315，doubao-seed-1-6-flash-250715（有点垃圾）
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                # 修正：添加完整的 data: 前缀
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": (
-                                "返回被方框框起来的单词和短语，用逗号分隔"
-                                # "返回格式要求：返回的单词都用单数、第一人称而且是现在时态，不能用复数、第三人称或者过去式，用逗号分隔"
-                                # "这篇文章中有一些英文单词或短语被方框框住了。请你按照以下要求处理这些被框起来的内容："
-                                # "要求："
-                                # "1.列出所有被方框框起来的英文单词或短语。"
-                                # "2.筛选符合以下标准的短语："
-                                # "核心特征：该短语由 2 个及以上单词组成，但其整体语义无法通过组成单词的字面意思直接组合推导，属于固定搭配、习语、成语或具有特殊引申义的表达（即 “语义不可拆分”）。"
-                                # "排除标准：若短语的语义可由组成单词的字面意思简单叠加得出（如 “generally speaking”=“generally（一般地）+ speaking（说）”→“一般来说”），无特殊引申义，则排除此类短语。"
-                                # "3.对于不符合上述标准的短语，返回其中一个词义比较重要的单词。"
-                                # "返回要求：以逗号分隔的形式返回，"
-                                # "返回示例：apple, banana, cat,take on"
-                            )
-                        },
-                    ],
-                }
-            ],
-        )
+def analyze_image_with_meanings(image_path):
+    """
+    识别图片中被方框框起来的单词，同时让视觉模型给出带词性的中文释义，省去之后逐词查询释义的往返。
 
-        result = response.choices[0].message.content.strip()
-        return result
+    Returns:
+        tuple: (识别结果, {word: ((pos, gloss), ...)})。识别结果与 analyze_image 相同，为逗号分隔的单词，
+               出错时为错误文字。释义缺失或格式不对（缺少词性）的单词不在字典中，由调用方再逐词查询。
+    """
+    # 延迟导入：generateWord 导入时要求 ARK_API_KEY，只做识别时不需要
+    from generateWord import TRANSLATIONS_JSON_PROMPT, parse_model_json
+    from entries import senses_from_translations
 
+    try:
+        if not is_image_file(image_path):
+            return "错误：请提供一个有效的图像文件（jpg/png）", {}
+        prompt = (
+            "找出图片中被方框框起来的英文单词和短语，按它们在图片中出现的顺序，为每一个提供中文释义。"
+            "要求：1. " + TRANSLATIONS_JSON_PROMPT +
+            "2. 不要包含任何其他解释、说明或 Markdown。"
+        )
+        reply = _call_vision_model(image_path, prompt, "words+meanings")
     except Exception as e:
-        return f"分析失败：{str(e)}"
+        return f"分析失败：{str(e)}", {}
+
+    with span("vision.parse") as s:
+        try:
+            data = parse_model_json(reply)
+            items = data.get("translations", []) if isinstance(data, dict) else []
+            words = [str(item["word"]).strip() for item in items
+                     if isinstance(item, dict) and str(item.get("word") or "").strip()]
+            senses = senses_from_translations(data, require_pos=True)
+        except ValueError:
+            words, senses = None, {}
+            s["error"] = "invalid_json"
+        if words is not None:
+            words = list(dict.fromkeys(words))
+            s["words"] = len(words)
+            s["with_meanings"] = len(senses)
+
+    if words is None:
+        # 没有按要求返回 JSON（或回复被截断），单词列表也不可信：改用普通识别，释义全部逐词查询
+        LLM_JSON_PARSE_FAILURES.inc()
+        print(f"⚠️ 视觉模型没有返回有效的 JSON，改为只识别单词。原始回复：{reply}")
+        return analyze_image(image_path), {}
+    return ", ".join(words), senses
 
 
 def save_result_to_file(result, filename="word.txt"):
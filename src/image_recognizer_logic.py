@@ -1,44 +1,29 @@
 # src/image_recognizer_logic.py
 import sys
 import os
-from PyQt5.QtWidgets import QMainWindow, QFileDialog, QMessageBox
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtWidgets import (QMainWindow, QFileDialog, QMessageBox, QLabel, QTableWidget,
+                             QTableWidgetItem, QProgressBar, QHeaderView, QAbstractItemView, QCheckBox)
+from PyQt5.QtCore import Qt, QUrl
+from PyQt5.QtGui import QFont, QDesktopServices
 from MainWindow import Ui_MainWindow
-from image_analyzer import analyze_image, save_result_to_file
-from generateWord import generate_dictation_books  # 导入新模块
-
-
-class AnalysisThread(QThread):
-    """分析线程，避免界面卡顿"""
-    analysis_finished = pyqtSignal(str)  # 分析完成信号
-    analysis_error = pyqtSignal(str)  # 分析错误信号
-
-    def __init__(self, image_path):
-        super().__init__()
-        self.image_path = image_path
-
-    def run(self):
-        try:
-            result = analyze_image(self.image_path)
-            self.analysis_finished.emit(result)
-        except Exception as e:
-            self.analysis_error.emit(str(e))
-
-
-class GenerateWordThread(QThread):
-    """生成Word文档线程"""
-    generate_finished = pyqtSignal(bool, str)  # 生成完成信号 (成功/失败, 消息)
-
-    def __init__(self, input_file='word.txt'):
-        super().__init__()
-        self.input_file = input_file
-
-    def run(self):
-        try:
-            success, message = generate_dictation_books(self.input_file)
-            self.generate_finished.emit(success, message)
-        except Exception as e:
-            self.generate_finished.emit(False, f"生成失败：{str(e)}")
+from image_analyzer import save_result_to_file
+from generateWord import PROGRESS_LOOKUP, PROGRESS_BATCH, PROGRESS_RENDER
+from jobs import JOB_ANALYZE, JOB_IMAGE, PROGRESS_VISION, STATUS_DONE
+from job_manager import JobManager
+from profiling import DEFAULT_MODE as PROFILE_MODE
+
+# 任务列表的列
+COLUMN_JOB = 0
+COLUMN_STATUS = 1
+COLUMN_PROGRESS = 2
+COLUMN_RESULT = 3
+
+STAGE_NAMES = {
+    PROGRESS_VISION: "识别图片",
+    PROGRESS_LOOKUP: "查询释义",
+    PROGRESS_BATCH: "大模型批次",
+    PROGRESS_RENDER: "生成文档",
+}
 
 
 class MainWindow(QMainWindow):
@@ -47,14 +32,47 @@ class MainWindow(QMainWindow):
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
 
+        # 任务管理器：分析和生成任务排队，在共享线程池中执行
+        self.job_manager = JobManager(parent=self)
+        self.job_rows = {}  # 任务号 -> 任务列表中的行号
+        self.last_result = ""  # 保存最后的分析结果
+        self.last_result_created_at = 0.0  # 当前显示结果所属任务的提交时间
+
         # 初始化界面
+        self.setup_job_list()
         self.setup_connections()
         self.setup_ui()
 
-        # 线程
-        self.analysis_thread = None
-        self.generate_thread = None
-        self.last_result = ""  # 保存最后的分析结果
+    def setup_job_list(self):
+        """在识别结果下方添加任务列表（MainWindow.py 由 pyuic5 生成，不直接修改）"""
+        label = QLabel("任务列表：", self.ui.centralwidget)
+        font = QFont()
+        font.setFamily("楷体")
+        font.setPointSize(14)
+        label.setFont(font)
+        self.ui.gridLayout.addWidget(label, 3, 0, 1, 1, Qt.AlignTop)
+
+        self.job_table = QTableWidget(0, 4, self.ui.centralwidget)
+        self.job_table.setHorizontalHeaderLabels(["任务", "状态", "进度", "结果"])
+        self.job_table.verticalHeader().setVisible(False)
+        self.job_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.job_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        header = self.job_table.horizontalHeader()
+        header.setSectionResizeMode(COLUMN_JOB, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(COLUMN_STATUS, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(COLUMN_PROGRESS, QHeaderView.Interactive)
+        header.setSectionResizeMode(COLUMN_RESULT, QHeaderView.Stretch)
+        self.job_table.setColumnWidth(COLUMN_PROGRESS, 200)
+        self.job_table.setToolTip("双击任务打开其输出目录")
+        self.ui.gridLayout.addWidget(self.job_table, 3, 1, 1, 3)
+
+        # 性能分析开关：勾选后新提交的任务会在其目录的 profile/ 中写入调用栈和内存分配报告
+        self.checkBoxProfile = QCheckBox("性能分析（报告保存在任务目录的 profile 文件夹中）", self.ui.centralwidget)
+        self.ui.gridLayout.addWidget(self.checkBoxProfile, 4, 1, 1, 3)
+
+        # 一步生成：识别图片时让视觉模型一并给出释义，识别完成后直接生成听写本（适合单词较少的练习页）
+        self.checkBoxVisionMeanings = QCheckBox("识别时同时获取释义并直接生成听写本", self.ui.centralwidget)
+        self.ui.gridLayout.addWidget(self.checkBoxVisionMeanings, 5, 1, 1, 3)
 
     def setup_connections(self):
         """连接信号和槽"""
@@ -70,6 +88,15 @@ class MainWindow(QMainWindow):
         # 路径输入框回车事件
         self.ui.lineEditImagePath.returnPressed.connect(self.analyze_image)
 
+        # 任务管理器的信号（在工作线程中发出，由 Qt 排队到界面线程）
+        self.job_manager.job_added.connect(self.on_job_added)
+        self.job_manager.job_started.connect(self.on_job_started)
+        self.job_manager.job_progress.connect(self.on_job_progress)
+        self.job_manager.job_finished.connect(self.on_job_finished)
+
+        # 双击任务打开输出目录
+        self.job_table.cellDoubleClicked.connect(self.open_job_dir)
+
     def setup_ui(self):
         """设置界面初始状态"""
         self.setWindowTitle("图像文字识别工具")
@@ -91,7 +118,7 @@ class MainWindow(QMainWindow):
             self.statusBar().showMessage(f"已选择图片: {os.path.basename(file_path)}")
 
     def analyze_image(self):
-        """分析图片"""
+        """把图片分析任务加入队列"""
         image_path = self.ui.lineEditImagePath.text().strip()
 
         if not image_path:
@@ -102,28 +129,130 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "警告", "图片文件不存在")
             return
 
-        # 禁用按钮，显示正在分析
-        self.ui.buttonAnalyze.setEnabled(False)
-        self.ui.buttonBrowse.setEnabled(False)
-        self.ui.buttonGenerateWord.setEnabled(False)  # 生成按钮也禁用
-        self.statusBar().showMessage("正在分析图片，请稍候...")
-
-        # 启动分析线程
-        self.analysis_thread = AnalysisThread(image_path)
-        self.analysis_thread.analysis_finished.connect(self.on_analysis_finished)
-        self.analysis_thread.analysis_error.connect(self.on_analysis_error)
-        self.analysis_thread.finished.connect(self.on_thread_finished)
-        self.analysis_thread.start()
-
-    def on_analysis_finished(self, result):
-        """分析完成"""
+        if self.checkBoxVisionMeanings.isChecked():
+            self.job_manager.submit_image(image_path, vision_meanings=True, profile=self.profile_mode())
+        else:
+            self.job_manager.submit_analysis(image_path, self.profile_mode())
+        self.statusBar().showMessage(f"已加入队列：分析 {os.path.basename(image_path)}"
+                                     f"（未完成任务 {self.job_manager.unfinished_count()} 个）")
+
+    def generate_word_docs(self):
+        """把生成听写本任务加入队列"""
+        # 检查word.txt文件是否存在
+        if not os.path.exists("word.txt"):
+            QMessageBox.warning(self, "警告", "未找到 word.txt 文件，请先进行图片分析")
+            return
+
+        try:
+            self.job_manager.submit_generation("word.txt", self.profile_mode())
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"无法创建任务：{str(e)}")
+            return
+        self.statusBar().showMessage(f"已加入队列：生成听写本"
+                                     f"（未完成任务 {self.job_manager.unfinished_count()} 个）")
+
+    def profile_mode(self):
+        """勾选性能分析时返回分析模式（环境变量 PROFILE_MODE，默认采样），否则返回 None"""
+        return PROFILE_MODE if self.checkBoxProfile.isChecked() else None
+
+    # --- 任务列表 ---
+    def on_job_added(self, job_id):
+        job = self.job_manager.jobs[job_id]
+        row = self.job_table.rowCount()
+        self.job_table.insertRow(row)
+        self.job_rows[job_id] = row
+
+        if job.kind == JOB_ANALYZE:
+            title = f"分析 {os.path.basename(job.input_path)}"
+        elif job.kind == JOB_IMAGE:
+            title = f"分析并生成 {os.path.basename(job.input_path)}"
+        else:
+            title = "生成听写本"
+        if job.profile:
+            title += "（性能分析）"
+        item = QTableWidgetItem(title)
+        item.setToolTip(job.output_dir)
+        self.job_table.setItem(row, COLUMN_JOB, item)
+        self.job_table.setItem(row, COLUMN_STATUS, QTableWidgetItem("排队中"))
+        self.job_table.setItem(row, COLUMN_RESULT, QTableWidgetItem(""))
+
+        bar = QProgressBar()
+        bar.setRange(0, 1)
+        bar.setValue(0)
+        bar.setFormat("等待中")
+        self.job_table.setCellWidget(row, COLUMN_PROGRESS, bar)
+        self.job_table.scrollToBottom()
+
+    def on_job_started(self, job_id):
+        self.job_table.item(self.job_rows[job_id], COLUMN_STATUS).setText("运行中")
+
+    def on_job_progress(self, job_id, stage, done, total):
+        row = self.job_rows[job_id]
+        name = STAGE_NAMES.get(stage, stage)
+        if stage == PROGRESS_BATCH:
+            # 大模型批次与单词查询同时进行，显示在状态列，进度条仍显示单词数
+            self.job_table.item(row, COLUMN_STATUS).setText(f"运行中（{name} {done}/{total}）")
+            return
+        bar = self.job_table.cellWidget(row, COLUMN_PROGRESS)
+        bar.setRange(0, max(total, 1))
+        bar.setValue(done)
+        bar.setFormat(f"{name} {done}/{total}")
+
+    def on_job_finished(self, job_id):
+        job = self.job_manager.jobs[job_id]
+        row = self.job_rows[job_id]
+        success = job.status == STATUS_DONE
+
+        self.job_table.item(row, COLUMN_STATUS).setText("完成" if success else "失败")
+        bar = self.job_table.cellWidget(row, COLUMN_PROGRESS)
+        bar.setRange(0, 1)
+        bar.setValue(1 if success else 0)
+        bar.setFormat("完成" if success else "失败")
+        result = self.job_table.item(row, COLUMN_RESULT)
+        result.setText(job.message.split("\n")[0])
+        result.setToolTip("\n".join(filter(None, [job.message, job.trace_summary,
+                                                  job.profile_summary, job.output_dir])))
+
+        if job.kind == JOB_ANALYZE:
+            self.on_analysis_finished(job)
+        elif job.kind == JOB_IMAGE:
+            if job.result_text:
+                self.on_analysis_finished(job)
+            self.on_generate_finished(job)
+        else:
+            self.on_generate_finished(job)
+
+    def open_job_dir(self, row, column):
+        """双击任务：打开任务的输出目录"""
+        for job_id, job_row in self.job_rows.items():
+            if job_row == row:
+                QDesktopServices.openUrl(QUrl.fromLocalFile(self.job_manager.jobs[job_id].output_dir))
+                return
+
+    # --- 任务结果 ---
+    def on_analysis_finished(self, job):
+        """分析完成（一步生成的任务在生成失败时也可能已经有识别结果）"""
+        if job.status != STATUS_DONE and not job.result_text:
+            self.statusBar().showMessage(f"分析失败：{job.message}")
+            self.append_trace_summary(job)
+            return
+
+        # 多个分析任务并行时，只显示最近提交的那个任务的结果
+        if job.created_at < self.last_result_created_at:
+            self.statusBar().showMessage(f"{os.path.basename(job.input_path)} 分析完成，结果见任务列表")
+            self.append_trace_summary(job)
+            return
+        self.last_result_created_at = job.created_at
+
+        result = job.result_text
         self.ui.textEditResult.setPlainText(result)
         self.last_result = result  # 保存结果
 
         # 自动保存结果
         self.auto_save_result(result)
 
-        self.statusBar().showMessage("分析完成，结果已自动保存")
+        # 在状态栏追加耗时分解
+        self.append_trace_summary(job)
 
     def auto_save_result(self, result):
         """自动保存结果到文件"""
@@ -131,8 +260,6 @@ class MainWindow(QMainWindow):
             try:
                 if save_result_to_file(result, "word.txt"):
                     self.statusBar().showMessage("分析完成，结果已自动保存到 word.txt")
-                    # 启用生成听写本按钮
-                    self.ui.buttonGenerateWord.setEnabled(True)
                 else:
                     self.statusBar().showMessage("分析完成，但保存文件失败")
             except Exception as e:
@@ -140,46 +267,27 @@ class MainWindow(QMainWindow):
         else:
             self.statusBar().showMessage("分析完成，但没有识别到结果")
 
-    def on_analysis_error(self, error):
-        """分析出错"""
-        QMessageBox.critical(self, "错误", f"分析失败：{error}")
-        self.statusBar().showMessage("分析失败")
-
-    def on_thread_finished(self):
-        """线程结束"""
-        self.ui.buttonAnalyze.setEnabled(True)
-        self.ui.buttonBrowse.setEnabled(True)
-
-    def generate_word_docs(self):
-        """生成听写本Word文档"""
-        # 检查word.txt文件是否存在
-        if not os.path.exists("word.txt"):
-            QMessageBox.warning(self, "警告", "未找到 word.txt 文件，请先进行图片分析")
-            return
+    def append_trace_summary(self, job):
+        """在当前状态栏消息后追加任务的耗时分解"""
+        summary = getattr(job, "trace_summary", "") if job else ""
+        if summary:
+            self.statusBar().showMessage(f"{self.statusBar().currentMessage()}（{summary}）")
 
-        # 禁用按钮，显示正在生成
-        self.ui.buttonGenerateWord.setEnabled(False)
-        self.ui.buttonAnalyze.setEnabled(False)
-        self.ui.buttonBrowse.setEnabled(False)
-        self.statusBar().showMessage("正在生成听写本，请稍候...")
-
-        # 启动生成线程
-        self.generate_thread = GenerateWordThread("word.txt")
-        self.generate_thread.generate_finished.connect(self.on_generate_finished)
-        self.generate_thread.finished.connect(self.on_generate_thread_finished)
-        self.generate_thread.start()
-
-    def on_generate_finished(self, success, message):
-        """生成完成"""
-        if success:
-            QMessageBox.information(self, "成功", message)
-            self.statusBar().showMessage("听写本生成完成")
+    def on_generate_finished(self, job):
+        """生成完成：不弹出对话框，以免连续使用时打断操作；失败原因见任务列表"""
+        if job.status == STATUS_DONE:
+            self.statusBar().showMessage(f"听写本生成完成，已保存到 {job.output_dir}")
         else:
-            QMessageBox.critical(self, "错误", message)
-            self.statusBar().showMessage("听写本生成失败")
-
-    def on_generate_thread_finished(self):
-        """生成线程结束"""
-        self.ui.buttonGenerateWord.setEnabled(True)
-        self.ui.buttonAnalyze.setEnabled(True)
-        self.ui.buttonBrowse.setEnabled(True)
\ No newline at end of file
+            self.statusBar().showMessage(f"听写本生成失败：{job.message}")
+        self.append_trace_summary(job)
+
+    def closeEvent(self, event):
+        """关闭窗口时取消排队中的任务"""
+        unfinished = self.job_manager.unfinished_count()
+        if unfinished:
+            reply = QMessageBox.question(self, "确认退出", f"还有 {unfinished} 个任务未完成，确定要退出吗？")
+            if reply != QMessageBox.Yes:
+                event.ignore()
+                return
+        self.job_manager.shutdown()
+        event.accept()
@@ -0,0 +1,104 @@
+# src/job_manager.py
+"""
+图形界面的任务管理器：图片分析和听写本生成任务进入队列，在共享的线程池中执行，
+并通过 Qt 信号报告细粒度的进度（识别图片、已查到释义的单词数、大模型批次、文档渲染）。
+
+每个任务使用独立的输出目录（jobs/<时间>-<任务号前8位>），多个任务同时排队、
+同时运行也不会互相覆盖文件。
+"""
+import os
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from jobs import Job, run_job, JOB_ANALYZE, JOB_IMAGE, JOB_WORDS, WORD_LIST_NAME, STATUS_FAILED
+
+DEFAULT_JOBS_DIR = os.environ.get("GUI_JOBS_DIR", "jobs")
+DEFAULT_WORKERS = int(os.environ.get("GUI_JOB_WORKERS", "2"))
+PROGRESS_INTERVAL = 0.1  # 同一任务同一阶段两次进度信号的最小间隔（秒），避免大词库刷新过于频繁
+
+
+class JobManager(QObject):
+    """
+    任务队列 + 共享线程池。
+
+    信号在工作线程中发出，连接到界面对象的槽时由 Qt 自动排队到界面线程执行。
+    """
+    job_added = pyqtSignal(str)                     # 任务号
+    job_started = pyqtSignal(str)                   # 任务号
+    job_progress = pyqtSignal(str, str, int, int)   # 任务号, 阶段, 已完成, 总数
+    job_finished = pyqtSignal(str)                  # 任务号（结果见 jobs[任务号]）
+
+    def __init__(self, jobs_dir=DEFAULT_JOBS_DIR, workers=DEFAULT_WORKERS, parent=None):
+        super().__init__(parent)
+        self.jobs_dir = os.path.abspath(jobs_dir)
+        self.jobs = {}  # 任务号 -> Job，按提交顺序
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gui-job")
+        self._lock = threading.Lock()
+        self._last_emit = {}  # 任务号 -> {阶段: 上次发出进度信号的时间}
+
+    def submit_analysis(self, image_path, profile=None):
+        """
+        识别图片中的单词，结果保存为任务目录下的 word.txt。
+        profile 为性能分析模式（profiling.MODE_*），报告写入任务目录的 profile/ 中。
+        """
+        return self._submit(self._new_job(JOB_ANALYZE, image_path, profile))
+
+    def submit_image(self, image_path, vision_meanings=False, profile=None):
+        """识别图片并直接生成听写本；vision_meanings 为 True 时由视觉模型一并给出释义"""
+        job = self._new_job(JOB_IMAGE, image_path, profile)
+        job.vision_meanings = vision_meanings
+        return self._submit(job)
+
+    def submit_generation(self, word_file, profile=None):
+        """根据单词列表生成听写本；先把列表复制到任务目录，排队期间修改原文件不影响该任务"""
+        job = self._new_job(JOB_WORDS, None, profile)
+        job.input_path = os.path.join(job.output_dir, WORD_LIST_NAME)
+        shutil.copyfile(word_file, job.input_path)
+        return self._submit(job)
+
+    def unfinished_count(self):
+        """排队中和运行中的任务数"""
+        return sum(1 for job in list(self.jobs.values()) if not job.finished)
+
+    def shutdown(self):
+        """取消排队中的任务；运行中的任务在后台线程中结束"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _new_job(self, kind, input_path, profile=None):
+        job = Job(kind, input_path, None, profile=profile)
+        job.output_dir = os.path.join(self.jobs_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{job.id[:8]}")
+        os.makedirs(job.output_dir, exist_ok=True)
+        return job
+
+    def _submit(self, job):
+        self.jobs[job.id] = job
+        self.job_added.emit(job.id)
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        self.job_started.emit(job.id)
+        try:
+            run_job(job, progress=self._on_progress)
+        except Exception as e:
+            # run_job 自己会捕获任务中的异常，这里只兜底（例如无法创建输出目录）
+            job._set(status=STATUS_FAILED, message=f"任务失败：{str(e)}", finished_at=time.time())
+        finally:
+            with self._lock:
+                self._last_emit.pop(job.id, None)
+            self.job_finished.emit(job.id)
+
+    def _on_progress(self, job, stage, done, total):
+        """（工作线程）节流后发出进度信号；每个阶段的开始和结束总会发出"""
+        now = time.monotonic()
+        with self._lock:
+            stages = self._last_emit.setdefault(job.id, {})
+            last = stages.get(stage)
+            if last is not None and 0 < done < total and now - last < PROGRESS_INTERVAL:
+                return
+            stages[stage] = now
+        self.job_progress.emit(job.id, stage, done, total)
@@ -0,0 +1,159 @@
+# src/jobs.py
+import os
+import time
+import uuid
+import threading
+
+from image_analyzer import analyze_image, analyze_image_with_meanings, save_result_to_file
+from generateWord import generate_dictation_books, MEANING_DOC_NAME, BLANK_DOC_NAME
+from tracing import start_job, finish_job
+from profiling import Profiler, PROFILE_DIR_NAME
+from metrics import JOBS_IN_PROGRESS
+
+# 任务类型
+JOB_IMAGE = "image"   # 图片 → 识别单词 → 生成听写本
+JOB_WORDS = "words"   # 单词列表 → 生成听写本
+JOB_ANALYZE = "analyze"  # 图片 → 识别单词（只保存单词列表，供图形界面使用）
+
+# 任务状态
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# 进度阶段（其余阶段见 generateWord 中的 PROGRESS_*）
+PROGRESS_VISION = "vision"
+
+WORD_LIST_NAME = "word.txt"
+
+
+class Job:
+    """一次听写本生成任务，所有输入输出都放在自己的 output_dir 中"""
+
+    def __init__(self, kind, input_path, output_dir, job_id=None, profile=None, vision_meanings=False):
+        if kind not in (JOB_IMAGE, JOB_WORDS, JOB_ANALYZE):
+            raise ValueError(f"未知任务类型: {kind}")
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.input_path = input_path
+        self.output_dir = output_dir
+        self.status = STATUS_QUEUED
+        self.message = ""
+        self.words = []          # 识别出的单词（仅图片任务）
+        self.result_text = ""    # 图片识别的原始结果（仅图片任务）
+        self.progress = {}       # 阶段 -> (已完成, 总数)
+        self.files = []          # 生成的文档路径
+        self.trace_summary = ""
+        self.trace_file = None
+        self.profile = profile   # 性能分析模式（profiling.MODE_*），None 为不分析
+        self.vision_meanings = vision_meanings  # 图片任务：识别时让视觉模型一并给出释义
+        self.profile_files = []
+        self.profile_summary = ""
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in (STATUS_DONE, STATUS_FAILED)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "message": self.message,
+                "words": list(self.words),
+                "progress": {stage: list(value) for stage, value in self.progress.items()},
+                "files": [os.path.basename(path) for path in self.files],
+                "trace_summary": self.trace_summary,
+                "profile": self.profile,
+                "vision_meanings": self.vision_meanings,
+                "profile_summary": self.profile_summary,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+    def _set(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def _set_progress(self, stage, done, total):
+        with self._lock:
+            self.progress[stage] = (done, total)
+
+
+def run_job(job, progress=None, router=None):
+    """
+    在当前线程中执行任务（阻塞），结果写回 job 并返回 job。
+
+    Args:
+        progress (callable, optional): progress(job, 阶段, 已完成, 总数)，在执行任务的线程中调用。
+        router (LookupRouter, optional): 释义查询路由，默认使用进程内共享的路由器。
+    """
+    def report(stage, done, total):
+        job._set_progress(stage, done, total)
+        if progress:
+            progress(job, stage, done, total)
+
+    os.makedirs(job.output_dir, exist_ok=True)
+    job._set(status=STATUS_RUNNING, started_at=time.time())
+    tracer = start_job(f"{job.kind}-{job.id[:8]}")
+    JOBS_IN_PROGRESS.labels(kind=job.kind).inc()
+    try:
+        if job.profile:
+            profiler = Profiler(os.path.join(job.output_dir, PROFILE_DIR_NAME), job.profile,
+                                name=f"{job.kind}-{job.id[:8]}")
+            try:
+                with profiler:
+                    success, message = _run(job, report, router)
+            finally:
+                job._set(profile_files=profiler.files, profile_summary=profiler.summary)
+        else:
+            success, message = _run(job, report, router)
+    except Exception as e:
+        success, message = False, f"任务失败：{str(e)}"
+    finally:
+        JOBS_IN_PROGRESS.labels(kind=job.kind).dec()
+        trace_file, summary = finish_job(tracer, os.path.join(job.output_dir, "traces"))
+
+    names = (WORD_LIST_NAME,) if job.kind == JOB_ANALYZE else (MEANING_DOC_NAME, BLANK_DOC_NAME)
+    files = [os.path.join(job.output_dir, name) for name in names]
+    job._set(
+        status=STATUS_DONE if success else STATUS_FAILED,
+        message=message,
+        files=[path for path in files if success and os.path.exists(path)],
+        trace_summary=summary,
+        trace_file=trace_file,
+        finished_at=time.time(),
+    )
+    return job
+
+
+def _run(job, report, router=None):
+    word_file = job.input_path
+    known_senses = None
+    if job.kind in (JOB_IMAGE, JOB_ANALYZE):
+        report(PROGRESS_VISION, 0, 1)
+        if job.kind == JOB_IMAGE and job.vision_meanings:
+            # 识别与释义合为一次请求，之后只查询视觉模型没有给出有效释义的单词
+            result, known_senses = analyze_image_with_meanings(job.input_path)
+        else:
+            result = analyze_image(job.input_path)
+        # analyze_image 出错时返回错误文字而不是抛出异常
+        if result.startswith("分析失败：") or result.startswith("错误："):
+            return False, result
+        word_file = os.path.join(job.output_dir, WORD_LIST_NAME)
+        if not save_result_to_file(result, word_file):
+            return False, "保存识别结果失败"
+        words = [item.strip() for item in result.split(',') if item.strip()]
+        job._set(words=words, result_text=result)
+        report(PROGRESS_VISION, 1, 1)
+        if job.kind == JOB_ANALYZE:
+            return True, f"识别完成，共 {len(words)} 个单词"
+    return generate_dictation_books(word_file, job.output_dir, router=router, progress=report,
+                                    known_senses=known_senses)
@@ -0,0 +1,462 @@
+# src/lookup_router.py
+"""
+释义查询路由：在本地缓存、小小API和大模型之间选择查询路径。
+
+- 本地缓存命中的单词直接返回
+- 按单词“形状”（单词 / 两词短语 / 多词短语）统计小小API的近期未命中率，
+  未命中率很高的形状直接交给大模型，不再等待小小API；其中少量单词仍发给小小API试探，
+  使统计能跟上小小API的变化
+- 熔断器：小小API连续失败时暂时跳过它，冷却后放行一次试探请求
+- 对冲：小小API响应时间超过历史延迟的某个分位数时，同时向大模型发出请求，先返回者胜出
+- 记录每个单词最终采用的来源，并把形状统计写回缓存，使路由随时间自适应
+"""
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from generateWord import fetch_word_senses, call_large_model_api
+from meaning_cache import MeaningCache
+from entries import (EntryStore, STATUS_RESOLVED, STATUS_NOT_FOUND, STATUS_FAILED,
+                     SOURCE_CACHE, SOURCE_XXAPI, SOURCE_LLM, SOURCE_VISION,
+                     parse_meaning, format_senses, senses_from_translations)
+from tracing import span, wrap
+from metrics import (LOOKUP_BACKEND_WINS, LOOKUP_HEDGES, LOOKUP_DIRECT_LLM,
+                     XXAPI_CIRCUIT_OPEN, LLM_FALLBACK_WORDS)
+
+XXAPI_SKIPPED = (STATUS_FAILED, (), "小小API熔断中，已跳过")
+
+
+def word_shape(word):
+    """按单词数划分的“形状”，用于统计小小API的命中率"""
+    count = len(word.split())
+    if count <= 1:
+        return "word"
+    if count == 2:
+        return "phrase2"
+    return "phrase3+"
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后打开，cooldown 秒后半开并放行一次试探请求"""
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def allow(self):
+        """是否发出请求；半开时第一个调用者取得唯一的试探名额，之后须记录其成功或失败"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and time.monotonic() - self._opened_at >= self.cooldown:
+                self._probing = True  # 半开：只放行一个请求
+                return True
+            return False
+
+    def is_cooling_down(self):
+        """只读检查：熔断器已打开，且仍在冷却或试探请求尚未返回（不占用试探名额）"""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            return self._probing or time.monotonic() - self._opened_at < self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+        XXAPI_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+                opened = True
+            else:
+                opened = False
+        if opened:
+            XXAPI_CIRCUIT_OPEN.set(1)
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+
+class RateLimiter:
+    """令牌桶限速：平均每秒最多 rate 次，允许 burst 次突发"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        """取得一个令牌，没有令牌时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+
+class LatencyWindow:
+    """最近若干次小小API响应时间，用于计算对冲阈值"""
+
+    def __init__(self, size=200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class LookupRouter:
+    """并发、可对冲、带熔断的释义查询"""
+
+    def __init__(self, cache=None, xxapi_workers=8, llm_workers=2, batch_size=20,
+                 hedge_percentile=0.95, min_hedge_delay=0.3, default_hedge_delay=2.0,
+                 direct_llm_miss_rate=0.8, min_shape_samples=20, batch_linger=0.5,
+                 breaker=None, xxapi_limiter=None, llm_limiter=None, max_in_flight=None,
+                 shape_probe_every=20, shape_stats_window=200):
+        self.cache = cache
+        # 每次 resolve 同时提交给小小API线程池的请求上限，避免一个大任务占满共享线程池、阻塞其他任务
+        self.max_in_flight = max(1, max_in_flight or xxapi_workers)
+        self.batch_size = batch_size
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.direct_llm_miss_rate = direct_llm_miss_rate
+        self.min_shape_samples = min_shape_samples
+        self.shape_probe_every = shape_probe_every    # 预测未命中的单词中每隔多少个仍发给小小API试探
+        self.shape_stats_window = shape_stats_window  # 形状统计只保留约这么多个样本的权重，旧样本按比例衰减
+        self.batch_linger = batch_linger
+        self.breaker = breaker or CircuitBreaker()
+        self.xxapi_limiter = xxapi_limiter  # RateLimiter，限制小小API请求频率（None 为不限速）
+        self.llm_limiter = llm_limiter      # RateLimiter，限制大模型批次的发送频率
+        self.latency = LatencyWindow()
+        self.wins = {SOURCE_VISION: 0, SOURCE_CACHE: 0, SOURCE_XXAPI: 0, SOURCE_LLM: 0}
+        self._stats_lock = threading.Lock()
+        self.shape_stats = {shape: self._decay(stats)
+                            for shape, stats in (cache.load_route_stats() if cache else {}).items()}
+        self._probe_counts = {}
+        self._unsaved_shape_stats = {}  # 尚未写入缓存的形状统计增量，每次 resolve 结束时一并写入
+        self._xxapi_pool = ThreadPoolExecutor(max_workers=xxapi_workers, thread_name_prefix="xxapi")
+        self._llm_pool = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="llm")
+
+    # --- 路由决策 ---
+    def hedge_delay(self):
+        """小小API超过该时间仍未返回时发出对冲请求"""
+        if len(self.latency) < 10:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, self.latency.percentile(self.hedge_percentile))
+
+    def predicted_miss(self, word):
+        """该形状的单词在小小API上历史未命中率是否足够高，值得直接交给大模型"""
+        with self._stats_lock:
+            hits, misses = self.shape_stats.get(word_shape(word), (0, 0))
+        total = hits + misses
+        return total >= self.min_shape_samples and misses / total >= self.direct_llm_miss_rate
+
+    def should_probe(self, word):
+        """预测未命中的单词每 shape_probe_every 个仍有一个发给小小API，否则该形状的统计再也不会更新"""
+        shape = word_shape(word)
+        with self._stats_lock:
+            count = self._probe_counts[shape] = self._probe_counts.get(shape, 0) + 1
+        return count % self.shape_probe_every == 0
+
+    def _decay(self, stats):
+        """样本数超过 shape_stats_window 时按比例缩小，使近期结果占主要权重"""
+        total = stats[0] + stats[1]
+        if total > self.shape_stats_window:
+            scale = self.shape_stats_window / total
+            stats[0] *= scale
+            stats[1] *= scale
+        return stats
+
+    def _record_shape(self, word, hit):
+        shape = word_shape(word)
+        with self._stats_lock:
+            stats = self.shape_stats.setdefault(shape, [0, 0])
+            stats[0 if hit else 1] += 1
+            self._decay(stats)
+            # 写入缓存的是未衰减的增量，加载时再按窗口缩小
+            self._unsaved_shape_stats.setdefault(shape, [0, 0])[0 if hit else 1] += 1
+
+    def _save(self, meanings):
+        """把本次查询得到的释义和累积的形状统计写入缓存（各一次提交，而不是每个单词提交一次）"""
+        if not self.cache:
+            return
+        with self._stats_lock:
+            shape_stats, self._unsaved_shape_stats = self._unsaved_shape_stats, {}
+        try:
+            self.cache.put_many(meanings)
+            self.cache.add_route_stats_many(shape_stats)
+        except Exception as e:
+            print(f"⚠️ 写入本地释义缓存失败：{e}")
+
+    def _record_win(self, source, count=1):
+        with self._stats_lock:
+            self.wins[source] += count
+        LOOKUP_BACKEND_WINS.labels(backend=source).inc(count)
+
+    # --- 后端调用（在线程池中执行）---
+    def _query_xxapi(self, word, running):
+        # 排队期间熔断器可能已经打开
+        if not self.breaker.allow():
+            LOOKUP_DIRECT_LLM.labels(reason="circuit_open").inc()
+            return XXAPI_SKIPPED
+        if self.xxapi_limiter:
+            self.xxapi_limiter.acquire()
+        running[word] = time.monotonic()
+        start = time.perf_counter()
+        result = fetch_word_senses(word)
+        elapsed = time.perf_counter() - start
+        status = result[0]
+        if status == STATUS_FAILED:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+            self.latency.add(elapsed)
+            self._record_shape(word, status == STATUS_RESOLVED)
+        return result
+
+    def _query_llm(self, batch):
+        if self.llm_limiter:
+            self.llm_limiter.acquire()
+        try:
+            return senses_from_translations(call_large_model_api(batch))
+        except Exception as e:
+            print(f"❌ 调用大模型或解析其响应时出错: {e}")
+            return {}
+
+    # --- 主流程 ---
+    def resolve(self, words, progress=None, batch_progress=None, known=None):
+        """
+        查询一组单词的释义。
+
+        Args:
+            words (list): 单词或短语列表（可重复）。
+            progress (callable, optional): progress(已完成数, 总数)，每解决一个单词调用一次。
+            batch_progress (callable, optional): batch_progress(已完成批数, 已发出批数)，
+                每发出或完成一批大模型请求时调用一次。
+            known (dict, optional): {word: ((pos, gloss), ...)}，已经得到的释义（例如视觉模型在识别图片时
+                一并给出的），直接采用但不写入缓存，只有其余单词才会查询。
+
+        Returns:
+            EntryStore: 每个单词一个 Entry；查不到释义的单词状态为 STATUS_NOT_FOUND 或 STATUS_FAILED。
+        """
+        store = EntryStore(words)
+        unique = store.pending_words()
+        total = len(unique)
+
+        def report():
+            if progress:
+                progress(total - store.pending_count, total)
+
+        new_meanings = []  # 新查到的 (word, 释义, 来源)，结束时一次写入缓存
+
+        def settle(word, senses, source):
+            if not store.resolve(word, senses, source):
+                return False
+            self._record_win(source)
+            # 视觉模型顺带给出的释义只用于本次任务，不写入共享缓存，以免之后的任务不再查询小小API
+            if source not in (SOURCE_CACHE, SOURCE_VISION):
+                new_meanings.append((word, format_senses(senses), source))
+            report()
+            return True
+
+        def give_up(word, status, error=None):
+            if store.fail(word, status, error=error):
+                report()
+
+        try:
+            with span("lookup.resolve", words=total) as s:
+                # 第零步：调用方已经给出的释义
+                for word, senses in (known or {}).items():
+                    if word in store:
+                        settle(word, senses, SOURCE_VISION)
+
+                # 第一步：本地缓存
+                if self.cache:
+                    for word, (meaning, _) in self.cache.get_many(store.pending_words()).items():
+                        senses = parse_meaning(meaning)
+                        if senses:
+                            settle(word, senses, SOURCE_CACHE)
+
+                # 第二步：分流——直接交给大模型，或排队等待查小小API
+                llm_queue = []          # 等待组批的单词
+                queued_at = None        # 队列中最早单词的入队时间
+                xxapi_queue = deque()   # 尚未提交的小小API单词，同时在途的请求不超过 max_in_flight
+                xxapi_futures = {}      # 已提交、尚未处理结果的 future -> word（含对冲后不再等待的）
+                running = {}            # word -> 小小API请求实际开始的时间（由工作线程写入）
+                xxapi_failed = {}       # 小小API已确认无法给出释义的单词 -> (状态, 错误信息)
+                llm_failed = set()      # 大模型已返回但没有给出释义的单词
+                in_llm = set()
+
+                def enqueue_llm(word):
+                    nonlocal queued_at
+                    if word in in_llm or not store.is_pending(word):
+                        return
+                    in_llm.add(word)
+                    llm_queue.append(word)
+                    if queued_at is None:
+                        queued_at = time.monotonic()
+
+                query_xxapi = wrap(self._query_xxapi)
+                for word in unique:
+                    if not store.is_pending(word):
+                        continue
+                    if self.predicted_miss(word) and not self.should_probe(word):
+                        LOOKUP_DIRECT_LLM.labels(reason="predicted_miss").inc()
+                        enqueue_llm(word)
+                    elif self.breaker.is_cooling_down():
+                        # 只做只读检查：冷却结束后的试探名额留给真正发出请求的工作线程
+                        LOOKUP_DIRECT_LLM.labels(reason="circuit_open").inc()
+                        enqueue_llm(word)
+                    else:
+                        xxapi_queue.append(word)
+
+                # 第三步：等待小小API，按需对冲，并把需要大模型的单词组批发送
+                llm_futures = {}  # future -> batch
+                query_llm = wrap(self._query_llm)
+                completed = queue.SimpleQueue()  # 已完成的 future，由 add_done_callback 放入
+                hedged = 0
+                batches_done = 0
+
+                def submit(pool, fn, *args):
+                    future = pool.submit(fn, *args)
+                    future.add_done_callback(completed.put)
+                    return future
+
+                while store.pending_count:
+                    while xxapi_queue and len(xxapi_futures) < self.max_in_flight:
+                        word = xxapi_queue.popleft()
+                        xxapi_futures[submit(self._xxapi_pool, query_xxapi, word, running)] = word
+
+                    now = time.monotonic()
+                    delay = self.hedge_delay()
+                    for word, started_at in list(running.items()):
+                        if word not in in_llm and store.is_pending(word) and now - started_at >= delay:
+                            LOOKUP_HEDGES.inc()
+                            hedged += 1
+                            enqueue_llm(word)
+
+                    waiting_on_xxapi = bool(xxapi_queue) or any(store.is_pending(word) and word not in in_llm
+                                                                for word in xxapi_futures.values())
+                    if llm_queue and (len(llm_queue) >= self.batch_size or not waiting_on_xxapi
+                                      or now - queued_at >= self.batch_linger):
+                        for i in range(0, len(llm_queue), self.batch_size):
+                            batch = llm_queue[i:i + self.batch_size]
+                            llm_futures[submit(self._llm_pool, query_llm, batch)] = batch
+                        llm_queue = []
+                        queued_at = None
+                        if batch_progress:
+                            batch_progress(batches_done, batches_done + len(llm_futures))
+
+                    if not xxapi_futures and not llm_futures:
+                        break
+                    # 每次只处理新完成的 future，而不是反复扫描全部 future
+                    done = []
+                    try:
+                        done.append(completed.get(timeout=0.05))
+                        while not completed.empty():
+                            done.append(completed.get_nowait())
+                    except queue.Empty:
+                        pass
+                    for future in done:
+                        if future in xxapi_futures:
+                            word = xxapi_futures.pop(future)
+                            running.pop(word, None)
+                            if not store.is_pending(word):
+                                # 对冲后已由大模型解决：结果只用于更新统计
+                                continue
+                            result = future.result()
+                            status, senses, error = result
+                            if status != STATUS_RESOLVED:
+                                xxapi_failed[word] = (status, error)
+                                if word in llm_failed:
+                                    give_up(word, status, error)
+                                else:
+                                    # 只统计小小API确实没有给出释义的单词；对冲和熔断跳过的单词另有计数
+                                    if word not in in_llm and result is not XXAPI_SKIPPED:
+                                        LLM_FALLBACK_WORDS.inc()
+                                    enqueue_llm(word)
+                            else:
+                                settle(word, senses, SOURCE_XXAPI)
+                        elif future in llm_futures:
+                            batch = llm_futures.pop(future)
+                            translations = future.result()
+                            batches_done += 1
+                            if batch_progress:
+                                batch_progress(batches_done, batches_done + len(llm_futures))
+                            for word in batch:
+                                senses = translations.get(word)
+                                if senses:
+                                    settle(word, senses, SOURCE_LLM)
+                                elif word in xxapi_failed or word not in xxapi_futures.values():
+                                    # 大模型也没有给出结果，且小小API不会再返回
+                                    give_up(word, *xxapi_failed.get(word, (STATUS_NOT_FOUND, None)))
+                                else:
+                                    # 对冲请求没有结果，继续等待小小API
+                                    llm_failed.add(word)
+
+                for word in store.pending_words():
+                    give_up(word, *xxapi_failed.get(word, (STATUS_NOT_FOUND, None)))
+
+                s["hedged"] = hedged
+                s["sources"] = store.source_counts()
+                s["statuses"] = store.counts()
+        finally:
+            self._save(new_meanings)
+        return store
+
+    def close(self):
+        self._save([])
+        self._xxapi_pool.shutdown(wait=False)
+        self._llm_pool.shutdown(wait=False)
+
+
+_default_router = None
+_default_lock = threading.Lock()
+
+
+def get_default_router():
+    """进程内共享的路由器（含默认的本地缓存）"""
+    global _default_router
+    with _default_lock:
+        if _default_router is None:
+            try:
+                cache = MeaningCache()
+            except Exception as e:
+                print(f"⚠️ 无法打开本地释义缓存，将不使用缓存：{e}")
+                cache = None
+            _default_router = LookupRouter(cache)
+        return _default_router
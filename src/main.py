@@ -1,16 +1,24 @@
 # src/main.py
 import sys
 import os
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from image_recognizer_logic import MainWindow
+from metrics import start_from_env
 
 
 def main():
+    # 打包为可执行文件时，多进程渲染的子进程需要它
+    multiprocessing.freeze_support()
+
     # 设置应用程序属性
     app = QApplication(sys.argv)
     app.setApplicationName("图像文字识别工具")
     app.setApplicationVersion("1.0")
 
+    # 按环境变量启动指标导出（METRICS_PORT / METRICS_FILE）
+    start_from_env()
+
     # 创建并显示主窗口
     window = MainWindow()
     window.show()
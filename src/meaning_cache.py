@@ -0,0 +1,108 @@
+# src/meaning_cache.py
+import os
+import time
+import sqlite3
+import threading
+
+# 本地释义缓存文件，可通过环境变量 MEANING_CACHE_PATH 修改
+DEFAULT_CACHE_PATH = os.environ.get("MEANING_CACHE_PATH", "meaning_cache.sqlite3")
+
+
+def cache_key(word):
+    """缓存键：忽略首尾空白、大小写和多余空格"""
+    return " ".join(word.split()).lower()
+
+
+class MeaningCache:
+    """
+    基于 SQLite 的本地释义缓存。
+
+    只缓存成功的释义（来源为 xxapi 或 llm），“未找到”和请求失败不会写入。
+    同时保存查询路由的统计数据，使路由策略在多次运行之间持续生效。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meanings ("
+                " word TEXT PRIMARY KEY, meaning TEXT NOT NULL, source TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS route_stats ("
+                " shape TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.commit()
+
+    def get(self, word):
+        """返回 (释义, 来源)，未缓存时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT meaning, source FROM meanings WHERE word = ?", (cache_key(word),)).fetchone()
+        return tuple(row) if row else None
+
+    def get_many(self, words):
+        """批量查询，返回 {word: (释义, 来源)}，只包含命中的单词"""
+        keys = {}
+        for word in words:
+            keys.setdefault(cache_key(word), []).append(word)
+        found = {}
+        key_list = list(keys)
+        with self._lock:
+            for i in range(0, len(key_list), 500):  # SQLite 参数个数有上限
+                chunk = key_list[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT word, meaning, source FROM meanings WHERE word IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                for key, meaning, source in rows:
+                    for word in keys[key]:
+                        found[word] = (meaning, source)
+        return found
+
+    def put(self, word, meaning, source):
+        self.put_many([(word, meaning, source)])
+
+    def put_many(self, items):
+        """批量写入 [(word, 释义, 来源), ...]，只提交一次"""
+        now = time.time()
+        rows = [(cache_key(word), meaning, source, now) for word, meaning, source in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meanings (word, meaning, source, updated_at) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM meanings").fetchone()[0]
+
+    def load_route_stats(self):
+        """返回 {shape: [hits, misses]}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT shape, hits, misses FROM route_stats").fetchall()
+        return {shape: [hits, misses] for shape, hits, misses in rows}
+
+    def add_route_stats(self, shape, hits=0, misses=0):
+        self.add_route_stats_many({shape: (hits, misses)})
+
+    def add_route_stats_many(self, stats):
+        """批量累加 {shape: (hits, misses)}，只提交一次"""
+        if not stats:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO route_stats (shape, hits, misses) VALUES (?, ?, ?) "
+                "ON CONFLICT(shape) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                [(shape, hits, misses) for shape, (hits, misses) in stats.items()])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
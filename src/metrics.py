@@ -0,0 +1,443 @@
+# src/metrics.py
+import os
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认的延迟分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels):
+    """将标签字典格式化为 Prometheus 文本格式"""
+    if not labels:
+        return ""
+    inner = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in sorted(labels.items())
+    )
+    return "{" + inner + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类，支持按标签区分多个序列"""
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self.labels()  # 无标签指标预先创建序列，以便导出初始值 0
+
+    def labels(self, **labels):
+        """返回指定标签值对应的子序列"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._new_child()
+                self._children[key] = child
+            return child
+
+    def _default(self):
+        """无标签指标直接使用唯一的子序列"""
+        if self.labelnames:
+            raise ValueError(f"指标 {self.name} 带有标签 {self.labelnames}，请先调用 labels()")
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        """返回 [(标签字典, 子序列), ...]"""
+        with self._lock:
+            items = list(self._children.items())
+        return [(dict(zip(self.labelnames, key)), child) for key, child in items]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, child in self.collect():
+            lines.extend(self._render_child(labels, child))
+        return lines
+
+
+class _CounterValue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def get(self, **labels):
+        """读取当前值（主要用于本地报告）"""
+        return (self.labels(**labels) if labels else self._default()).value
+
+    def _render_child(self, labels, child):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.value)}"]
+
+
+class _GaugeValue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """读取时调用 function() 取值，适用于需要实时计算的指标"""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class Gauge(_Metric):
+    """可增可减的即时值"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+    def get(self, **labels):
+        return (self.labels(**labels) if labels else self._default()).get()
+
+    def _render_child(self, labels, child):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.get())}"]
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q):
+        """按分桶线性插值估算分位数（与 Prometheus 的 histogram_quantile 一致）"""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if total == 0:
+            return None
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for index, bucket_count in enumerate(counts):
+            upper = self.buckets[index] if index < len(self.buckets) else float("inf")
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = upper if upper != float("inf") else lower
+        return lower
+
+
+class Histogram(_Metric):
+    """分桶直方图，用于记录延迟分布"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        """上下文管理器：记录 with 块的耗时"""
+        return self._default().time()
+
+    def quantile(self, q, **labels):
+        return (self.labels(**labels) if labels else self._default()).quantile(q)
+
+    def _render_child(self, labels, child):
+        lines = []
+        cumulative = 0
+        with child._lock:
+            counts = list(child.counts)
+            total_sum = child.sum
+            total_count = child.count
+        for upper, bucket_count in zip(list(self.buckets) + [float("inf")], counts):
+            cumulative += bucket_count
+            bucket_labels = dict(labels, le=_format_value(upper))
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total_sum)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {total_count}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """以 Prometheus 文本格式导出全部指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _RateWindow:
+    """滑动窗口内的事件计数（用于“每小时视觉调用次数”等指标）"""
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._events = deque()
+
+    def mark(self):
+        with self._lock:
+            self._events.append(time.monotonic())
+
+    def count(self):
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            while self._events and self._events[0] < cutoff:
+                self._events.popleft()
+            return len(self._events)
+
+
+# --- 业务指标 ---
+XXAPI_LATENCY = REGISTRY.histogram(
+    "xxapi_lookup_seconds", "fetch_word_senses 调用小小API的耗时")
+XXAPI_LOOKUPS = REGISTRY.counter(
+    "xxapi_lookups_total", "小小API查询次数，按结果区分（hit/miss/error）", ["result"])
+LLM_LATENCY = REGISTRY.histogram(
+    "llm_call_seconds", "call_doubao_model 调用大模型的耗时")
+LLM_CALLS = REGISTRY.counter(
+    "llm_calls_total", "大模型调用次数，按状态区分（ok/error）", ["status"])
+LLM_JSON_PARSE_FAILURES = REGISTRY.counter(
+    "llm_json_parse_failures_total", "大模型回复无法解析为 JSON 的次数")
+LLM_FALLBACK_WORDS = REGISTRY.counter(
+    "llm_fallback_words_total", "小小API未找到释义（或请求出错）而交给大模型翻译的单词数；"
+    "对冲和跳过小小API的单词分别见 lookup_hedges_total 和 lookup_direct_llm_total")
+VISION_CALLS = REGISTRY.counter(
+    "vision_calls_total", "视觉模型调用次数，按状态区分（ok/error）", ["status"])
+VISION_LATENCY = REGISTRY.histogram(
+    "vision_call_seconds", "analyze_image 调用视觉模型的耗时")
+XXAPI_MISS_RATIO = REGISTRY.gauge(
+    "xxapi_miss_ratio", "小小API未命中率（miss / 全部查询，尚无数据时为 0），即需要大模型补充释义的比例")
+VISION_CALLS_LAST_HOUR = REGISTRY.gauge(
+    "vision_calls_last_hour", "最近一小时内的视觉模型调用次数")
+JOBS_IN_PROGRESS = REGISTRY.gauge(
+    "jobs_in_progress", "正在运行的任务数，按类型区分", ["kind"])
+LOOKUP_BACKEND_WINS = REGISTRY.counter(
+    "lookup_backend_wins_total", "释义查询最终采用的来源（cache/xxapi/llm）", ["backend"])
+LOOKUP_HEDGES = REGISTRY.counter(
+    "lookup_hedges_total", "小小API响应过慢而发出对冲大模型请求的次数")
+LOOKUP_DIRECT_LLM = REGISTRY.counter(
+    "lookup_direct_llm_total", "跳过小小API直接交给大模型的单词数，按原因区分（predicted_miss/circuit_open）", ["reason"])
+XXAPI_CIRCUIT_OPEN = REGISTRY.gauge(
+    "xxapi_circuit_open", "小小API熔断器是否处于打开状态（1 为打开）")
+LATENCY_QUANTILES = REGISTRY.gauge(
+    "call_latency_quantile_seconds",
+    "由延迟直方图估算的分位数（call 为 xxapi/llm，quantile 为 0.5/0.95；尚无数据时为 0），"
+    "供没有 Prometheus 的指标文件直接查看", ["call", "quantile"])
+
+_vision_window = _RateWindow(3600)
+VISION_CALLS_LAST_HOUR.set_function(_vision_window.count)
+
+
+def mark_vision_call(status):
+    """记录一次视觉模型调用"""
+    VISION_CALLS.labels(status=status).inc()
+    _vision_window.mark()
+
+
+def xxapi_miss_rate():
+    """小小API未命中率（miss / 全部查询），尚无数据时返回 None"""
+    counts = {labels["result"]: child.value for labels, child in XXAPI_LOOKUPS.collect()}
+    total = sum(counts.values())
+    if not total:
+        return None
+    return counts.get("miss", 0) / total
+
+
+XXAPI_MISS_RATIO.set_function(lambda: xxapi_miss_rate() or 0.0)
+
+
+def _register_latency_quantiles():
+    for call, histogram in (("xxapi", XXAPI_LATENCY), ("llm", LLM_LATENCY)):
+        for q in (0.5, 0.95):
+            LATENCY_QUANTILES.labels(call=call, quantile=str(q)).set_function(
+                lambda histogram=histogram, q=q: histogram.quantile(q) or 0.0)
+
+
+_register_latency_quantiles()
+
+
+# --- 导出方式 ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 不在控制台打印每次抓取
+
+
+def start_http_server(port, addr="127.0.0.1", registry=REGISTRY):
+    """在后台线程中启动 /metrics 端点，返回 server 对象（可调用 shutdown() 停止）"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((addr, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    print(f"📈 指标端点已启动：http://{addr}:{server.server_port}/metrics")
+    return server
+
+
+def write_metrics_file(path, registry=REGISTRY):
+    """将当前指标原子地写入文件（可被 node_exporter textfile collector 读取）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def start_file_flusher(path, interval=15, registry=REGISTRY):
+    """在后台线程中每隔 interval 秒把指标写入文件，返回用于停止的 Event"""
+    stop_event = threading.Event()
+
+    def _loop():
+        while True:
+            try:
+                write_metrics_file(path, registry)
+            except Exception as e:
+                print(f"⚠️ 写入指标文件失败：{e}")
+            if stop_event.wait(interval):
+                break
+
+    threading.Thread(target=_loop, name="metrics-flush", daemon=True).start()
+    return stop_event
+
+
+def start_from_env():
+    """
+    根据环境变量启动指标导出：
+        METRICS_PORT: 启动 HTTP /metrics 端点
+        METRICS_FILE: 定期写入指标文件（间隔由 METRICS_FLUSH_INTERVAL 指定，默认 15 秒）
+    """
+    port = os.environ.get("METRICS_PORT")
+    if port:
+        try:
+            start_http_server(int(port), os.environ.get("METRICS_ADDR", "127.0.0.1"))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 启动指标端点失败：{e}")
+    path = os.environ.get("METRICS_FILE")
+    if path:
+        try:
+            interval = float(os.environ.get("METRICS_FLUSH_INTERVAL", "15"))
+        except ValueError as e:
+            print(f"⚠️ METRICS_FLUSH_INTERVAL 无效，使用默认的 15 秒：{e}")
+            interval = 15.0
+        start_file_flusher(path, interval)
+
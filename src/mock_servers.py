@@ -0,0 +1,448 @@
+# src/mock_servers.py
+"""
+本地模拟服务：用于在离线环境下进行性能测试。
+
+- 小小API（englishwords）模拟：返回与 v2.xxapi.cn 相同结构的 JSON
+- 方舟（OpenAI 兼容）模拟：实现 /chat/completions，支持可配置的延迟、错误率和截断
+
+两种服务都支持录制/回放：record 模式把请求转发到真实服务并保存响应，
+replay 模式只从录制文件中返回响应。
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+XXAPI_UPSTREAM = "https://v2.xxapi.cn"
+ARK_UPSTREAM = "https://ark.cn-beijing.volces.com"
+
+MODES = ("mock", "record", "replay")
+
+
+class MockConfig:
+    """模拟服务的行为配置"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, truncate_rate=0.0,
+                 miss_rate=0.1, vision_words=20, seed=0, token_latency=0.0, vision_invalid_rate=0.0):
+        self.latency = latency            # 每次请求的基础延迟（秒）
+        self.jitter = jitter              # 延迟随机抖动上限（秒）
+        self.error_rate = error_rate      # 返回 HTTP 500 的概率
+        self.truncate_rate = truncate_rate  # 大模型回复被截断的概率
+        self.miss_rate = miss_rate        # 小小API对单词返回“未找到”的比例（短语总是未找到）
+        self.vision_invalid_rate = vision_invalid_rate  # 识别 + 释义合并模式下视觉模型给出无效释义（缺词性或为空）的比例
+        self.vision_words = vision_words  # 视觉请求返回的单词数
+        self.token_latency = token_latency  # 方舟模拟中每个输出 token 额外的生成时间（秒）
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def roll(self, probability):
+        with self._lock:
+            return self.random.random() < probability
+
+    def sleep(self):
+        with self._lock:
+            delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Cassette:
+    """
+    录制文件（JSON Lines），按请求内容的哈希保存响应。
+
+    大模型批量翻译的每批单词取决于查询时的时序（组批等待、对冲、熔断），回放时几乎不会与录制时相同，
+    因此另外按单词保存翻译结果（{"word": ..., "meaning": ...} 行），回放时逐词作答。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        self.words = {}  # 单词 -> 录制到的释义
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        if "key" in entry:
+                            self.entries[entry["key"]] = entry
+                        else:
+                            self.words[entry["word"]] = entry["meaning"]
+
+    @staticmethod
+    def make_key(method, path, body):
+        """请求的唯一键：JSON 请求体按键排序后参与哈希，忽略字段顺序差异"""
+        if body:
+            try:
+                body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode('utf-8')
+            except ValueError:
+                pass
+        digest = hashlib.sha256()
+        digest.update(method.encode('utf-8'))
+        digest.update(path.encode('utf-8'))
+        digest.update(body or b"")
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            return self.entries.get(key)
+
+    def put(self, key, status, content_type, body):
+        entry = {"key": key, "status": status, "content_type": content_type,
+                 "body": body.decode('utf-8', errors='replace')}
+        with self._lock:
+            self.entries[key] = entry
+            self._append([entry])
+
+    def get_word(self, word):
+        with self._lock:
+            return self.words.get(word)
+
+    def put_words(self, meanings):
+        """保存 {单词: 释义}"""
+        if not meanings:
+            return
+        with self._lock:
+            self.words.update(meanings)
+            self._append([{"word": word, "meaning": meaning} for word, meaning in meanings.items()])
+
+    def _append(self, entries):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """模拟服务的公共逻辑：mock / record / replay 三种模式"""
+    protocol_version = "HTTP/1.1"
+    config = None
+    mode = "mock"
+    cassette = None
+    upstream = None
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, format, *args):
+        pass  # 不在控制台打印每次请求
+
+    def _handle(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        key = Cassette.make_key(method, self.path, body)
+
+        if self.mode == "replay":
+            entry = self.cassette.get(key)
+            if entry is None:
+                fallback = self.replay_fallback(method, body)
+                if fallback is not None:
+                    self.config.sleep()
+                    self._send(200, "application/json", json.dumps(fallback, ensure_ascii=False).encode('utf-8'))
+                    return
+                self._send(404, "application/json", json.dumps(
+                    {"error": {"message": f"回放文件中没有此请求: {method} {self.path}"}}).encode('utf-8'))
+                return
+            self.config.sleep()
+            self._send(entry["status"], entry["content_type"], entry["body"].encode('utf-8'))
+            return
+
+        if self.mode == "record":
+            status, content_type, payload = self._forward(method, body)
+            self.cassette.put(key, status, content_type, payload)
+            if status == 200:
+                self.record_extra(body, payload)
+            self._send(status, content_type, payload)
+            return
+
+        self.config.sleep()
+        if self.config.roll(self.config.error_rate):
+            self._send(500, "application/json", json.dumps(
+                {"error": {"message": "模拟的服务端错误", "type": "server_error"}}).encode('utf-8'))
+            return
+        status, payload = self.simulate(method, body)
+        self._send(status, "application/json", json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+    def _forward(self, method, body):
+        """record 模式：把请求原样转发到真实服务"""
+        headers = {name: value for name, value in self.headers.items()
+                   if name.lower() in ("authorization", "content-type", "user-agent", "accept")}
+        request = urllib.request.Request(self.upstream + self.path, data=body or None,
+                                         headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status, response.headers.get("Content-Type", "application/json"), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get("Content-Type", "application/json"), e.read()
+
+    def _send(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def simulate(self, method, body):
+        raise NotImplementedError
+
+    def replay_fallback(self, method, body):
+        """replay 模式下录制文件中没有完全相同的请求时的替代响应（JSON），None 为返回 404"""
+        return None
+
+    def record_extra(self, body, payload):
+        """record 模式下成功转发后额外保存的内容"""
+
+
+def _strip_code_fence(text):
+    """去掉模型回复外层的 ```json 代码块标记"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text
+
+
+def _fake_meanings(word):
+    """根据单词生成稳定的模拟释义"""
+    seed = int(hashlib.md5(word.encode('utf-8')).hexdigest(), 16)
+    pos_choices = ("n", "v", "adj", "adv")
+    count = 1 + seed % 3
+    return [(pos_choices[(seed >> (4 * i)) % len(pos_choices)], f"{word}的模拟释义{i + 1}")
+            for i in range(count)]
+
+
+class XxapiHandler(_MockHandler):
+    """小小API englishwords 接口模拟"""
+
+    def simulate(self, method, body):
+        query = parse_qs(urlparse(self.path).query)
+        word = (query.get("word") or [""])[0]
+        seed = int(hashlib.md5(word.encode('utf-8')).hexdigest(), 16)
+        # 小小API几乎查不到短语；单词按 miss_rate 稳定地返回未找到
+        if not word or " " in word.strip() or (seed % 1000) < self.config.miss_rate * 1000:
+            return 200, {"code": -2, "msg": "未找到该单词", "data": None}
+        translations = [{"pos": pos, "tran_cn": f" {meaning}"} for pos, meaning in _fake_meanings(word)]
+        return 200, {
+            "code": 200,
+            "msg": "数据请求成功",
+            "data": {
+                "word": word,
+                "ukphone": "",
+                "usphone": "",
+                "translations": translations,
+                "phrases": [],
+                "sentences": [],
+                "relWords": [],
+                "synonyms": [],
+            },
+        }
+
+
+class ArkHandler(_MockHandler):
+    """方舟 OpenAI 兼容 /chat/completions 接口模拟"""
+    _quoted = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+    @staticmethod
+    def _parse_request(body):
+        """返回 (请求 JSON, 最后一条消息的文字, 图片 URL 列表)"""
+        request = json.loads(body or b"{}")
+        content = request.get("messages", [{}])[-1].get("content", "")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        text = "".join(part.get("text", "") for part in parts if part.get("type") == "text")
+        images = [part.get("image_url", {}).get("url", "") for part in parts if part.get("type") == "image_url"]
+        return request, text, images
+
+    def _prompt_words(self, text):
+        # 批量翻译的提示词格式：... 单词列表: "a", "b", ...
+        _, _, word_list = text.rpartition("单词列表")
+        return self._quoted.findall(word_list)
+
+    def simulate(self, method, body):
+        if method != "POST" or not urlparse(self.path).path.endswith("/chat/completions"):
+            return 404, {"error": {"message": f"未知接口: {self.path}"}}
+        request, text, images = self._parse_request(body)
+
+        if images and "translations" in text:
+            reply = self._vision_meanings_reply(images[0])
+        elif images:
+            reply = ", ".join(self._vision_words(images[0]))
+        else:
+            reply = self._translation_reply(text)
+
+        if self.config.roll(self.config.truncate_rate):
+            reply = reply[:max(1, len(reply) // 2)]
+
+        return 200, self._completion(request, body, reply)
+
+    def _completion(self, request, body, reply):
+        prompt_tokens = max(1, len(body) // 4)
+        completion_tokens = max(1, len(reply.encode('utf-8')) // 4)
+        if self.config.token_latency:
+            time.sleep(completion_tokens * self.config.token_latency)
+        return {
+            "id": f"mock-{hashlib.md5(body).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def record_extra(self, body, payload):
+        """录制批量翻译时按单词保存释义，供回放时组成不同的批次"""
+        try:
+            _, text, images = self._parse_request(body)
+            if images or "单词列表" not in text:
+                return
+            reply = json.loads(payload)["choices"][0]["message"]["content"]
+            data = json.loads(_strip_code_fence(reply))
+        except (ValueError, KeyError, IndexError, TypeError):
+            return  # 无法解析的回复只按原始请求回放
+        meanings = {item["word"]: item["meaning"] for item in data.get("translations", [])
+                    if isinstance(item, dict) and item.get("word") and item.get("meaning")}
+        self.cassette.put_words(meanings)
+
+    def replay_fallback(self, method, body):
+        """批量翻译请求：逐词使用录制到的释义作答；一个单词都没有录制时返回 None（404）"""
+        if method != "POST":
+            return None
+        try:
+            request, text, images = self._parse_request(body)
+        except ValueError:
+            return None
+        if images:
+            return None
+        translations = []
+        for word in self._prompt_words(text):
+            meaning = self.cassette.get_word(word)
+            if meaning is not None:
+                translations.append({"word": word, "meaning": meaning})
+        if not translations:
+            return None
+        reply = "```json\n" + json.dumps({"translations": translations}, ensure_ascii=False) + "\n```"
+        return self._completion(request, body, reply)
+
+    def _vision_words(self, image_url):
+        """同一张图片总是识别出同样的单词"""
+        rng = random.Random(hashlib.md5(image_url.encode('utf-8')).hexdigest())
+        return [f"mockword{rng.randrange(100000)}" for _ in range(self.config.vision_words)]
+
+    def _vision_meanings_reply(self, image_url):
+        """识别 + 释义合并模式：返回 translations JSON，其中 vision_invalid_rate 比例的条目释义无效"""
+        translations = []
+        for word in self._vision_words(image_url):
+            if self.config.roll(self.config.vision_invalid_rate):
+                meaning = self.config.random.choice(["", f"{word}的释义（缺少词性）"])
+            else:
+                meaning = "\n".join(f"{pos}. {gloss}" for pos, gloss in _fake_meanings(word))
+            translations.append({"word": word, "meaning": meaning})
+        return "```json\n" + json.dumps({"translations": translations}, ensure_ascii=False) + "\n```"
+
+    def _translation_reply(self, text):
+        words = self._prompt_words(text)
+        translations = [{"word": word, "meaning": "\n".join(f"{pos}. {meaning}" for pos, meaning in _fake_meanings(word))}
+                        for word in words]
+        return "```json\n" + json.dumps({"translations": translations}, ensure_ascii=False) + "\n```"
+
+
+class MockServer:
+    """在后台线程中运行的模拟服务"""
+
+    def __init__(self, handler_class, config=None, mode="mock", cassette_path=None,
+                 upstream=None, port=0, host="127.0.0.1"):
+        if mode not in MODES:
+            raise ValueError(f"未知模式: {mode}（可选 {MODES}）")
+        if mode != "mock" and not cassette_path:
+            raise ValueError(f"{mode} 模式需要指定录制文件")
+        attrs = {
+            "config": config or MockConfig(),
+            "mode": mode,
+            "cassette": Cassette(cassette_path) if cassette_path else None,
+            "upstream": upstream,
+        }
+        handler = type(handler_class.__name__, (handler_class,), attrs)
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.host = host
+        self.port = self.httpd.server_port
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        name=f"mock-{handler_class.__name__}", daemon=True)
+        self._thread.start()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_xxapi(config=None, mode="mock", cassette_path=None, port=0):
+    """启动小小API模拟服务，返回 (MockServer, 可用于 XXAPI_URL 的地址)"""
+    server = MockServer(XxapiHandler, config, mode, cassette_path, XXAPI_UPSTREAM, port)
+    return server, f"{server.base_url}/api/englishwords"
+
+
+def start_ark(config=None, mode="mock", cassette_path=None, port=0):
+    """启动方舟模拟服务，返回 (MockServer, 可用于 ARK_BASE_URL 的地址)"""
+    server = MockServer(ArkHandler, config, mode, cassette_path, ARK_UPSTREAM, port)
+    return server, f"{server.base_url}/api/v3"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动小小API和方舟接口的本地模拟服务")
+    parser.add_argument("--xxapi-port", type=int, default=8801)
+    parser.add_argument("--ark-port", type=int, default=8802)
+    parser.add_argument("--mode", choices=MODES, default="mock")
+    parser.add_argument("--cassette-dir", default="cassettes", help="record/replay 模式的录制文件目录")
+    parser.add_argument("--latency", type=float, default=0.0, help="大模型请求的基础延迟（秒）")
+    parser.add_argument("--xxapi-latency", type=float, default=0.0, help="小小API请求的基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--miss-rate", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    xxapi_cassette = os.path.join(args.cassette_dir, "xxapi.jsonl") if args.mode != "mock" else None
+    ark_cassette = os.path.join(args.cassette_dir, "ark.jsonl") if args.mode != "mock" else None
+    xxapi_config = MockConfig(latency=args.xxapi_latency, jitter=args.jitter,
+                              error_rate=args.error_rate, miss_rate=args.miss_rate)
+    ark_config = MockConfig(latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate, truncate_rate=args.truncate_rate)
+    xxapi_server, xxapi_url = start_xxapi(xxapi_config, args.mode, xxapi_cassette, args.xxapi_port)
+    ark_server, ark_url = start_ark(ark_config, args.mode, ark_cassette, args.ark_port)
+    print(f"🧪 模拟服务已启动（{args.mode} 模式）")
+    print(f"   XXAPI_URL={xxapi_url}")
+    print(f"   ARK_BASE_URL={ark_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        xxapi_server.stop()
+        ark_server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# src/parallel_render.py
+"""
+多进程分片渲染：把词条按 shard_size 切片，在进程池中并行生成 python-docx 表格，
+绕开 GIL。可以每片输出一个文档，也可以把各片的表格行合并回一个文档
+（合并只做 XML 拼接，不再重新走 python-docx 的逐行构建）。
+
+默认使用进程内共享的一个进程池（进程数见 RENDER_WORKERS），多个任务同时渲染时
+子进程总数不会超过该值。子进程以 spawn 方式启动，不继承父进程中的线程池、
+SQLite 连接和性能分析采样线程。
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from lxml import etree
+from docx.oxml import parse_xml
+
+from generateWord import (new_dictation_document, add_meaning_row, add_blank_row, save_document,
+                          read_words_from_file, MEANING_DOC_NAME, BLANK_DOC_NAME)
+from entries import Entry, STATUS_RESOLVED, parse_meaning
+from tracing import span
+
+DEFAULT_SHARD_SIZE = 500
+# 共享进程池的进程数，默认为 CPU 核数
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", "0")) or os.cpu_count() or 1
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+KIND_MEANING = "带词意"
+KIND_BLANK = "无词意"
+_ROW_RENDERERS = {KIND_MEANING: add_meaning_row, KIND_BLANK: add_blank_row}
+_DOC_NAMES = {KIND_MEANING: MEANING_DOC_NAME, KIND_BLANK: BLANK_DOC_NAME}
+
+
+def shard_entries(entries, shard_size):
+    return [entries[i:i + shard_size] for i in range(0, len(entries), shard_size)]
+
+
+def _get_shared_pool():
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=_MP_CONTEXT)
+        return _shared_pool
+
+
+def _discard_shared_pool(pool):
+    """子进程异常退出后进程池不可再用，下次渲染时重新创建"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is pool:
+            _shared_pool = None
+    pool.shutdown(wait=False)
+
+
+def _render_shard_rows(kind, entries):
+    """（子进程）渲染一片词条，返回表格的 XML"""
+    _, table = new_dictation_document()
+    add_row = _ROW_RENDERERS[kind]
+    for entry in entries:
+        add_row(table, entry)
+    return etree.tostring(table._tbl)
+
+
+def _render_shard_file(kind, entries, output_filename):
+    """（子进程）渲染一片词条并直接保存为独立文档"""
+    doc, table = new_dictation_document()
+    add_row = _ROW_RENDERERS[kind]
+    for entry in entries:
+        add_row(table, entry)
+    doc.save(output_filename)
+    return output_filename
+
+
+def merge_shards(kind, table_xmls, output_filename):
+    """把各片表格的行按顺序拼接到一个新文档中并保存"""
+    with span("docx.merge", doc=kind, shards=len(table_xmls)):
+        doc, table = new_dictation_document()
+        target = table._tbl
+        for xml in table_xmls:
+            for tr in parse_xml(xml).tr_lst:
+                target.append(tr)
+    save_document(doc, output_filename, kind)
+    return output_filename
+
+
+def render_dictation_books_parallel(entries, output_dir='', shard_size=DEFAULT_SHARD_SIZE,
+                                    workers=None, merge=True):
+    """
+    并行渲染两份听写本。
+
+    Args:
+        entries (list): entries.Entry 列表（Entry 可以被 pickle 传给子进程）
+        shard_size (int): 每片词条数。
+        workers (int, optional): 使用独立的进程池并指定进程数；默认使用共享进程池（RENDER_WORKERS 个进程）。
+        merge (bool): True 时合并为与串行渲染相同的两个文档；
+                      False 时每片输出独立文档（“-第N部分”）。
+
+    Returns:
+        list: 生成的文件路径
+    """
+    from stream_pipeline import part_filename  # 与流式模式使用相同的分部分命名
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    shards = shard_entries(list(entries), shard_size)
+    if workers:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT)
+    else:
+        pool = _get_shared_pool()
+    try:
+        with span("docx.parallel", rows=len(entries), shards=len(shards), workers=workers or RENDER_WORKERS):
+            return _render_in_pool(pool, entries, output_dir, shards, merge, part_filename)
+    except BrokenProcessPool:
+        if not workers:
+            _discard_shared_pool(pool)
+        raise
+    finally:
+        if workers:
+            pool.shutdown()
+
+
+def _render_in_pool(pool, entries, output_dir, shards, merge, part_filename):
+    """在给定的进程池中渲染各片并合并或分别保存，返回生成的文件路径"""
+    files = []
+    if merge:
+        futures = {kind: [pool.submit(_render_shard_rows, kind, shard) for shard in shards]
+                   for kind in (KIND_MEANING, KIND_BLANK)}
+        for kind, kind_futures in futures.items():
+            with span("docx.build", doc=kind, rows=len(entries), shards=len(shards)):
+                table_xmls = [future.result() for future in kind_futures]
+            files.append(merge_shards(kind, table_xmls, os.path.join(output_dir, _DOC_NAMES[kind])))
+    else:
+        futures = []
+        for kind in (KIND_MEANING, KIND_BLANK):
+            for index, shard in enumerate(shards, start=1):
+                path = os.path.join(output_dir, part_filename(_DOC_NAMES[kind], index))
+                futures.append(pool.submit(_render_shard_file, kind, shard, path))
+        with span("docx.build", rows=len(entries), shards=len(shards)):
+            files = [future.result() for future in futures]
+        for path in files:
+            print(f"✅ 已保存为 {os.path.abspath(path)}")
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多进程渲染听写本（用于比较不同核数下的渲染耗时）")
+    parser.add_argument("input_file", help="单词列表文件；释义使用占位文字，只测量渲染")
+    parser.add_argument("--output-dir", default="")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="依次测试的进程数")
+    parser.add_argument("--split", action="store_true", help="每片输出独立文档，不合并")
+    args = parser.parse_args(argv)
+
+    words = read_words_from_file(args.input_file)
+    senses = parse_meaning("n. 占位释义一\nv. 占位释义二")
+    entries = [Entry(word, STATUS_RESOLVED, senses=senses) for word in words]
+    for workers in args.workers:
+        start = time.perf_counter()
+        render_dictation_books_parallel(entries, args.output_dir, args.shard_size, workers, not args.split)
+        print(f"⏱️ {len(entries)} 个词条，{workers} 个进程：{time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
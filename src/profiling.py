@@ -0,0 +1,278 @@
+# src/profiling.py
+"""
+任务性能分析：在 analyze_image / generate_dictation_books 外面套上性能分析器，
+并把报告写到任务输出目录的 profile/ 子目录中。
+
+- stacks.folded   采样得到的调用栈（折叠格式，每行“帧;帧;帧 次数”），
+                  可直接用 flamegraph.pl、speedscope 或 inferno 生成火焰图
+- report.txt      耗时、热点函数、内存峰值（每次采样时读取 tracemalloc）和分配最多的代码位置
+- profile.pstats  仅 cprofile 模式：确定性分析结果，可用 snakeviz / pstats 查看
+
+两种模式：
+- sample（默认）：后台线程每隔几毫秒采样一次各线程的调用栈，开销小，覆盖查询线程池
+- cprofile：在采样之外，再用 cProfile 对任务线程做确定性分析（开销较大，但有精确的调用次数）
+
+多进程渲染（parallel_render）的子进程不在分析范围内。多个任务同时做性能分析时，
+采样到的调用栈和内存峰值会包含其他任务（调用栈以线程名开头，可据此区分）。
+
+    python profiling.py words word.txt --output-dir out
+    python profiling.py image page.jpg --output-dir out --mode cprofile
+"""
+import os
+import sys
+import time
+import pstats
+import argparse
+import cProfile
+import threading
+import tracemalloc
+from io import StringIO
+from collections import Counter
+
+MODE_SAMPLE = "sample"
+MODE_CPROFILE = "cprofile"
+PROFILE_MODES = (MODE_SAMPLE, MODE_CPROFILE)
+DEFAULT_MODE = os.environ.get("PROFILE_MODE", MODE_SAMPLE)
+
+PROFILE_DIR_NAME = "profile"
+DEFAULT_INTERVAL = 0.005    # 采样间隔（秒）
+# tracemalloc 为每次分配保存的栈深度。深度为 1 时开销约为 3 倍，深度 10 时可达 20 倍，
+# 因此默认只记录分配所在的代码行；需要分配调用栈时可调大
+TRACEMALLOC_FRAMES = int(os.environ.get("PROFILE_TRACEMALLOC_FRAMES", "1"))
+TOP_N = 25
+PEAK_SNAPSHOT_GROWTH = 1.25  # 已记录内存比上次快照时增长到该倍数时，重新拍一次“峰值附近”的快照
+PEAK_CHECK_EVERY = 20        # 每隔多少次采样检查一次内存
+
+# 这些函数位于栈顶说明线程处于空闲等待（_worker 为线程池中等待任务的工作线程），
+# 任务线程以外的线程的这类样本不计入
+_IDLE_FUNCTIONS = {"wait", "_wait_for_tstate_lock", "select", "poll", "get", "accept", "_worker"}
+
+# tracemalloc 是进程级的：多个任务同时做性能分析时，由最后一个结束的任务停止它
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _acquire_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            _tracemalloc_owned = not tracemalloc.is_tracing()
+            if _tracemalloc_owned:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """定时采样所有线程的调用栈，统计折叠格式的栈出现次数"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, target_thread=None, on_tick=None):
+        self.interval = interval
+        self.on_tick = on_tick  # 每次采样后在采样线程中调用
+        self.target_thread = target_thread or threading.get_ident()  # 任务线程：空闲等待的样本也保留
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident != self.target_thread and frame.f_code.co_name in _IDLE_FUNCTIONS:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(labels))] += 1
+            if self.on_tick:
+                self.on_tick(self.samples)
+
+    def hot_functions(self, limit=TOP_N):
+        """[(栈顶函数, 样本数)]，即各函数的“自身时间”"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+    def write_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    上下文管理器：在 with 块执行期间采样调用栈、记录内存分配，退出时写出报告。
+
+        with Profiler(os.path.join(job.output_dir, "profile"), mode) as profiler:
+            generate_dictation_books(...)
+        print(profiler.summary)
+    """
+
+    def __init__(self, output_dir, mode=DEFAULT_MODE, name="", interval=DEFAULT_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"未知的性能分析模式: {mode}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.name = name
+        self.interval = interval
+        self.files = []
+        self.summary = ""
+        # 内存峰值（字节）：取本任务期间每次采样时 tracemalloc 的当前值的最大值。
+        # 不使用 tracemalloc 的全局峰值，因为重置它会抹掉其他正在分析的任务的峰值
+        self.peak = 0
+        self._sampler = None
+        self._cprofile = None
+        self._start = None
+        self._peak_snapshot = None
+        self._peak_snapshot_size = 0
+
+    def __enter__(self):
+        _acquire_tracemalloc()
+        self.peak = tracemalloc.get_traced_memory()[0]
+        self._sampler = StackSampler(self.interval, on_tick=self._check_memory)
+        self._sampler.start()
+        if self.mode == MODE_CPROFILE:
+            self._cprofile = cProfile.Profile()
+            try:
+                self._cprofile.enable()
+            except ValueError as e:
+                # Python 3.12 起同一时间只能有一个 cProfile 在运行
+                print(f"⚠️ 无法启用 cProfile，只进行采样分析：{e}")
+                self._cprofile = None
+        self._start = time.perf_counter()
+        return self
+
+    def _check_memory(self, samples):
+        """（采样线程）更新内存峰值；内存明显增长时拍快照，用于报告峰值附近分配最多的位置"""
+        current, _ = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, current)
+        if samples % PEAK_CHECK_EVERY:
+            return
+        if current > max(self._peak_snapshot_size * PEAK_SNAPSHOT_GROWTH, 1024 * 1024):
+            self._peak_snapshot = tracemalloc.take_snapshot()
+            self._peak_snapshot_size = current
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        if self._cprofile:
+            self._cprofile.disable()
+        self._sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[0])
+        _release_tracemalloc()
+        try:
+            self._write_report(elapsed, self.peak, snapshot)
+        except Exception as e:
+            print(f"⚠️ 写入性能分析报告失败：{e}")
+        return False
+
+    def _write_report(self, elapsed, peak, snapshot):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        folded_path = os.path.join(self.output_dir, "stacks.folded")
+        self._sampler.write_folded(folded_path)
+        self.files.append(folded_path)
+
+        lines = [
+            f"任务：{self.name}",
+            f"模式：{self.mode}（采样间隔 {self.interval * 1000:.0f}ms）",
+            f"耗时：{elapsed:.2f}s",
+            f"采样：{self._sampler.samples} 次",
+            f"内存峰值（tracemalloc，按采样）：{peak / 1024 / 1024:.1f} MiB",
+            "",
+            "== 热点函数（采样，按自身时间）==",
+        ]
+        total = sum(self._sampler.stacks.values()) or 1
+        for label, count in self._sampler.hot_functions():
+            lines.append(f"{count:8d}  {100.0 * count / total:5.1f}%  {label}")
+
+        if self._peak_snapshot is not None:
+            lines += ["", f"== 峰值附近（{self._peak_snapshot_size / 1024 / 1024:.1f} MiB）内存分配最多的位置 =="]
+            lines += _allocation_lines(self._peak_snapshot)
+        lines += ["", "== 任务结束时仍未释放的内存分配最多的位置 =="]
+        lines += _allocation_lines(snapshot)
+
+        if self._cprofile:
+            pstats_path = os.path.join(self.output_dir, "profile.pstats")
+            self._cprofile.dump_stats(pstats_path)
+            self.files.append(pstats_path)
+            lines += ["", "== cProfile（按累计时间）=="]
+            buffer = StringIO()
+            pstats.Stats(self._cprofile, stream=buffer).sort_stats("cumulative").print_stats(TOP_N)
+            lines.append(buffer.getvalue())
+
+        report_path = os.path.join(self.output_dir, "report.txt")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        self.files.append(report_path)
+        self.summary = f"性能分析：内存峰值 {peak / 1024 / 1024:.1f} MiB，报告见 {self.output_dir}"
+        print(f"🔬 {self.summary}")
+
+
+def _allocation_lines(snapshot):
+    """tracemalloc 快照中分配最多的代码行和调用栈"""
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    lines = ["-- 按代码行 --"]
+    for stat in snapshot.statistics("lineno")[:TOP_N]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:10.1f} KiB  {stat.count:8d} 块  {frame.filename}:{frame.lineno}")
+    if snapshot.traceback_limit <= 1:
+        return lines
+    lines.append("-- 按调用栈（前 5 个）--")
+    for stat in snapshot.statistics("traceback")[:5]:
+        lines.append(f"{stat.size / 1024:.1f} KiB，{stat.count} 块：")
+        lines.extend(f"    {line}" for line in stat.traceback.format(most_recent_first=True))
+    return lines
+
+
+def main(argv=None):
+    from jobs import Job, run_job, JOB_IMAGE, JOB_WORDS, JOB_ANALYZE, STATUS_DONE
+
+    parser = argparse.ArgumentParser(description="带性能分析地运行一次分析或生成任务")
+    parser.add_argument("kind", choices=[JOB_WORDS, JOB_IMAGE, JOB_ANALYZE],
+                        help="words：单词列表生成听写本；image：图片识别并生成；analyze：只识别图片")
+    parser.add_argument("input_path", help="单词列表文件或图片")
+    parser.add_argument("--output-dir", default="profile-job", help="任务输出目录（报告在其中的 profile/ 下）")
+    parser.add_argument("--mode", choices=PROFILE_MODES, default=DEFAULT_MODE)
+    args = parser.parse_args(argv)
+
+    job = run_job(Job(args.kind, os.path.abspath(args.input_path), args.output_dir, profile=args.mode))
+    print(job.message)
+    print(job.trace_summary)
+    for path in job.profile_files:
+        print(f"📄 {os.path.abspath(path)}")
+    return 0 if job.status == STATUS_DONE else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
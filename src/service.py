@@ -0,0 +1,280 @@
+# src/service.py
+"""
+HTTP 服务模式：让多位老师同时使用 图片 → 听写本 的生成流程。
+
+接口：
+    POST /jobs?type=image&filename=page.jpg   请求体为图片内容（加 &meanings=vision 时识别和释义合为一次视觉请求）
+    POST /jobs?type=words                     请求体为单词列表（每行一个，或逗号分隔）
+    GET  /jobs/<id>                           查询任务状态
+    GET  /jobs/<id>/files/<文件名>             下载生成的 .docx
+    GET  /metrics                             Prometheus 格式的指标
+
+任务进入有界队列，由固定数量的工作线程执行；队列满时返回 503，
+每个任务在独立的目录中读写文件。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+from jobs import Job, run_job, JOB_IMAGE, JOB_WORDS, WORD_LIST_NAME
+from metrics import REGISTRY
+from image_analyzer import SUPPORTED_FORMATS
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 上传内容大小上限
+MAX_HEADER_BYTES = 16 * 1024
+JOB_TTL = 24 * 3600  # 已完成任务及其文件的保留时间（秒）
+
+HTTP_REASONS = {
+    200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+QUEUE_DEPTH = REGISTRY.gauge("service_queue_depth", "服务模式下等待执行的任务数")
+
+IMAGE_CONTENT_TYPES = {"image/jpeg": ".jpg", "image/jpg": ".jpg", "image/png": ".png"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class DictationService:
+    """任务队列 + 工作线程池"""
+
+    def __init__(self, jobs_dir="jobs", workers=4, queue_size=32, job_ttl=JOB_TTL):
+        self.jobs_dir = os.path.abspath(jobs_dir)
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.jobs = {}
+        self.job_ttl = job_ttl
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dictation-worker")
+        self._tasks = []
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+
+    async def start(self):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        self._tasks.append(asyncio.create_task(self._cleanup_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    def submit(self, kind, payload, filename=None, content_type=None, vision_meanings=False):
+        """保存上传内容并把任务放入队列；队列已满时抛出 HttpError(503)"""
+        if self.queue.full():
+            raise HttpError(503, "任务队列已满，请稍后重试", {"Retry-After": "10"})
+
+        job = Job(kind, None, None, vision_meanings=vision_meanings)
+        job.output_dir = os.path.join(self.jobs_dir, job.id)
+        os.makedirs(job.output_dir, exist_ok=True)
+        try:
+            job.input_path = self._save_input(job, payload, filename, content_type)
+        except Exception:
+            shutil.rmtree(job.output_dir, ignore_errors=True)
+            raise
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job)
+        return job
+
+    def _save_input(self, job, payload, filename, content_type):
+        if job.kind == JOB_IMAGE:
+            ext = os.path.splitext(filename or "")[1].lower()
+            if ext not in SUPPORTED_FORMATS:
+                ext = IMAGE_CONTENT_TYPES.get((content_type or "").split(";")[0].strip().lower())
+            if not ext:
+                raise HttpError(400, f"仅支持以下图片格式：{', '.join(SUPPORTED_FORMATS)}")
+            path = os.path.join(job.output_dir, f"input{ext}")
+            with open(path, 'wb') as f:
+                f.write(payload)
+            return path
+
+        try:
+            text = payload.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise HttpError(400, "单词列表必须是 UTF-8 文本")
+        separators = "\n" if "\n" in text.strip() else ","
+        words = [item.strip() for item in text.split(separators) if item.strip()]
+        if not words:
+            raise HttpError(400, "单词列表为空")
+        path = os.path.join(job.output_dir, WORD_LIST_NAME)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(words) + "\n")
+        return path
+
+    async def _worker(self, index):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            try:
+                await loop.run_in_executor(self.executor, run_job, job)
+                print(f"📦 任务 {job.id} 结束：{job.status} {job.message}")
+            except Exception as e:
+                print(f"❌ 工作线程 {index} 执行任务 {job.id} 出错：{e}")
+            finally:
+                self.queue.task_done()
+
+    async def _cleanup_loop(self):
+        """定期删除过期任务的目录"""
+        while True:
+            await asyncio.sleep(min(self.job_ttl, 600))
+            cutoff = time.time() - self.job_ttl
+            for job_id, job in list(self.jobs.items()):
+                if job.finished and job.finished_at < cutoff:
+                    self.jobs.pop(job_id, None)
+                    shutil.rmtree(job.output_dir, ignore_errors=True)
+
+    def job_status(self, job):
+        data = job.to_dict()
+        data["downloads"] = [f"/jobs/{job.id}/files/{quote(name)}" for name in data["files"]]
+        return data
+
+    # --- HTTP 处理 ---
+    async def handle_connection(self, reader, writer):
+        try:
+            try:
+                method, target, headers, body = await self._read_request(reader)
+                status, response_headers, payload = self.route(method, target, headers, body)
+            except HttpError as e:
+                status, response_headers, payload = e.status, e.headers, _json({"error": e.message})
+            except Exception as e:
+                status, response_headers, payload = 500, {}, _json({"error": f"服务器内部错误：{e}"})
+            await self._write_response(writer, status, response_headers, payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise HttpError(400, "请求头过大")
+        if len(head) > MAX_HEADER_BYTES:
+            raise HttpError(400, "请求头过大")
+        lines = head.decode('latin-1').split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "无效的请求行")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if method == "POST":
+            if "content-length" not in headers:
+                raise HttpError(411, "缺少 Content-Length")
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                raise HttpError(400, "无效的 Content-Length")
+            if length < 0:
+                raise HttpError(400, "无效的 Content-Length")
+            if length > MAX_UPLOAD_BYTES:
+                raise HttpError(413, f"上传内容不能超过 {MAX_UPLOAD_BYTES // 1024 // 1024} MB")
+            body = await reader.readexactly(length)
+        return method, target, headers, body
+
+    async def _write_response(self, writer, status, headers, payload):
+        headers = dict(headers)
+        headers.setdefault("Content-Type", "application/json; charset=utf-8")
+        headers["Content-Length"] = str(len(payload))
+        headers["Connection"] = "close"
+        head = f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Unknown')}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode('latin-1') + b"\r\n" + payload)
+        await writer.drain()
+
+    def route(self, method, target, headers, body):
+        url = urlparse(target)
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+
+        if parts == ["metrics"] and method == "GET":
+            return 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}, REGISTRY.render().encode('utf-8')
+
+        if parts == ["jobs"]:
+            if method != "POST":
+                raise HttpError(405, "仅支持 POST")
+            kind = (query.get("type") or [JOB_WORDS])[0]
+            if kind not in (JOB_IMAGE, JOB_WORDS):
+                raise HttpError(400, f"type 只能是 {JOB_IMAGE} 或 {JOB_WORDS}")
+            vision_meanings = (query.get("meanings") or [""])[0] == "vision"
+            job = self.submit(kind, body, (query.get("filename") or [None])[0], headers.get("content-type"),
+                              vision_meanings)
+            return 202, {"Location": f"/jobs/{job.id}"}, _json(self.job_status(job))
+
+        if len(parts) >= 2 and parts[0] == "jobs":
+            if method != "GET":
+                raise HttpError(405, "仅支持 GET")
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HttpError(404, "任务不存在")
+            if len(parts) == 2:
+                return 200, {}, _json(self.job_status(job))
+            if len(parts) == 4 and parts[2] == "files":
+                if not job.finished:
+                    raise HttpError(409, "任务尚未完成")
+                for path in job.files:
+                    if os.path.basename(path) == parts[3]:
+                        with open(path, 'rb') as f:
+                            payload = f.read()
+                        return 200, {
+                            "Content-Type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(parts[3])}",
+                        }, payload
+                raise HttpError(404, "文件不存在")
+
+        raise HttpError(404, "接口不存在")
+
+
+def _json(data):
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+async def serve(host="127.0.0.1", port=8800, jobs_dir="jobs", workers=4, queue_size=32):
+    service = DictationService(jobs_dir, workers, queue_size)
+    await service.start()
+    server = await asyncio.start_server(service.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    print(f"🌐 听写本服务已启动：http://{host}:{port}（{workers} 个工作线程，队列上限 {queue_size}）")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以 HTTP 服务方式运行听写本生成流程")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--jobs-dir", default="jobs", help="任务文件的存放目录")
+    parser.add_argument("--workers", type=int, default=4, help="同时执行的任务数")
+    parser.add_argument("--queue-size", type=int, default=32, help="排队任务上限，超出时返回 503")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.jobs_dir, args.workers, args.queue_size))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
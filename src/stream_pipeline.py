@@ -0,0 +1,184 @@
+# src/stream_pipeline.py
+"""
+流式生成模式：用于数万词条的大词库。
+
+单词按块从文件读出 → 查询释义 → 写入文档，每个输出文档最多包含 part_size 个词条，
+写满即保存并释放。查询与渲染在两个线程中流水线进行，中间只保留有限个块，
+因此内存占用与词库大小无关。
+
+    python stream_pipeline.py vocabulary.txt --output-dir out --part-size 2000
+"""
+import gc
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+from itertools import islice
+
+from generateWord import (iter_words_from_file, new_dictation_document, add_meaning_row,
+                          add_blank_row, save_document, MEANING_DOC_NAME, BLANK_DOC_NAME)
+from tracing import span, wrap, current_tracer
+
+DEFAULT_CHUNK_SIZE = 200     # 每次查询的单词数
+DEFAULT_PART_SIZE = 2000     # 每个输出文档的词条数
+DEFAULT_MAX_CHUNKS = 2       # 查询线程最多领先渲染线程的块数
+TRACE_MAX_SPANS = 5000       # 追踪时最多逐条保存的 span 数，其余只累计次数和耗时
+
+_DONE = object()
+
+
+def iter_chunks(iterable, size):
+    """把可迭代对象切成长度为 size 的列表"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def part_filename(template, index):
+    """单词听写本（带词意）.docx -> 单词听写本（带词意）-第3部分.docx"""
+    stem, ext = os.path.splitext(template)
+    return f"{stem}-第{index}部分{ext}"
+
+
+class _PartWriter:
+    """同时写入带词意/无词意两份文档，写满 part_size 条后保存并开始下一部分"""
+
+    def __init__(self, output_dir, part_size):
+        self.output_dir = output_dir
+        self.part_size = part_size
+        self.part_index = 0
+        self.rows = 0
+        self.files = []
+        self._docs = None
+
+    def add(self, entry):
+        if self._docs is None:
+            self.part_index += 1
+            self._docs = (new_dictation_document(), new_dictation_document())
+        (_, meaning_table), (_, blank_table) = self._docs
+        add_meaning_row(meaning_table, entry)
+        add_blank_row(blank_table, entry)
+        self.rows += 1
+        if self.rows >= self.part_size:
+            self.flush()
+
+    def flush(self):
+        if self._docs is None:
+            return
+        docs, self._docs = self._docs, None
+        for (doc, _), template, kind in zip(docs, (MEANING_DOC_NAME, BLANK_DOC_NAME), ("带词意", "无词意")):
+            path = os.path.join(self.output_dir, part_filename(template, self.part_index))
+            save_document(doc, path, kind)
+            self.files.append(path)
+        del docs, doc
+        self.rows = 0
+        # python-docx 的对象之间有循环引用，文档的 lxml 树要等到循环垃圾回收才会释放，
+        # 不主动回收时已保存的部分会一直占用内存
+        gc.collect()
+
+
+def generate_dictation_books_streaming(input_file='word.txt', output_dir=None, router=None,
+                                       chunk_size=DEFAULT_CHUNK_SIZE, part_size=DEFAULT_PART_SIZE,
+                                       max_chunks=DEFAULT_MAX_CHUNKS, progress=None):
+    """
+    流式生成听写本，输出按 part_size 拆分的多份文档。
+
+    Args:
+        progress (callable, optional): progress(已完成词条数, 每秒词条数)，每写完一个块调用一次。
+
+    Returns:
+        tuple: (是否成功, 消息, 生成的文件列表)
+    """
+    output_dir = output_dir or ''
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    if router is None:
+        from lookup_router import get_default_router
+        router = get_default_router()
+
+    tracer = current_tracer()
+    if tracer is not None and tracer.max_spans is None:
+        # 每个单词都会产生查询 span，不设上限时追踪记录随词库大小线性增长
+        tracer.max_spans = TRACE_MAX_SPANS
+
+    resolved = queue.Queue(maxsize=max_chunks)  # 有界：查询线程最多领先 max_chunks 个块
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for chunk in iter_chunks(iter_words_from_file(input_file), chunk_size):
+                if stop.is_set():
+                    return
+                store = router.resolve(chunk)
+                resolved.put([store[word] for word in chunk])
+        except Exception as e:
+            errors.append(e)
+        finally:
+            resolved.put(_DONE)
+
+    producer = threading.Thread(target=wrap(produce), name="stream-lookup", daemon=True)
+    writer = _PartWriter(output_dir, part_size)
+    written = 0
+    start = time.perf_counter()
+    with span("stream.generate", chunk_size=chunk_size, part_size=part_size) as s:
+        producer.start()
+        try:
+            while True:
+                entries = resolved.get()
+                if entries is _DONE:
+                    break
+                with span("stream.render", rows=len(entries)):
+                    for entry in entries:
+                        writer.add(entry)
+                written += len(entries)
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    progress(written, written / elapsed if elapsed > 0 else 0.0)
+            writer.flush()
+        except Exception as e:
+            stop.set()
+            # 让查询线程从阻塞的 put 中退出
+            while producer.is_alive():
+                try:
+                    resolved.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return False, f"生成听写本失败：{str(e)}", writer.files
+        finally:
+            producer.join()
+        s["entries"] = written
+        s["parts"] = writer.part_index
+
+    if errors:
+        return False, f"读取或查询单词失败：{errors[0]}", writer.files
+    if not written:
+        return False, "没有找到单词数据", []
+    return True, f"听写本生成成功！共 {written} 个词条，拆分为 {writer.part_index} 部分，{len(writer.files)} 个文件", writer.files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以流式方式为大词库生成分部分的听写本")
+    parser.add_argument("input_file", help="单词列表文件（每行一个）")
+    parser.add_argument("--output-dir", default="", help="输出目录（默认当前目录）")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每次查询的单词数")
+    parser.add_argument("--part-size", type=int, default=DEFAULT_PART_SIZE, help="每个文档的词条数")
+    args = parser.parse_args(argv)
+
+    def report(done, rate):
+        print(f"📈 已完成 {done} 个词条（{rate:.1f} 条/秒）", flush=True)
+
+    success, message, files = generate_dictation_books_streaming(
+        args.input_file, args.output_dir, chunk_size=args.chunk_size, part_size=args.part_size,
+        progress=report)
+    print(message)
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# src/tracing.py
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# 每个任务的追踪文件输出目录
+TRACE_DIR = "traces"
+
+_local = threading.local()
+
+
+class Tracer:
+    """单个任务的追踪记录器，收集各阶段耗时 span"""
+
+    def __init__(self, job_name, max_spans=None):
+        self.job_name = job_name
+        self.spans = []  # 每项: {"name", "start", "dur", "depth", "tid", "attrs"}
+        # 最多逐条保存的 span 数（None 为不限）；超出后只按 (名称, 深度) 累计 [次数, 总耗时, 最大耗时]
+        self.max_spans = max_spans
+        self.dropped = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.started_at = time.time()
+        self.finished = None  # 任务结束时的相对时间（秒）
+
+    def record(self, name, start, duration, depth, attrs):
+        """记录一个已结束的 span（start 为相对任务开始的秒数）"""
+        with self._lock:
+            if self.max_spans is not None and len(self.spans) >= self.max_spans:
+                totals = self.dropped.setdefault((name, depth), [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += duration
+                totals[2] = max(totals[2], duration)
+                return
+            self.spans.append({
+                "name": name,
+                "start": start,
+                "dur": duration,
+                "depth": depth,
+                "tid": threading.get_ident(),
+                "attrs": attrs,
+            })
+
+    def elapsed(self):
+        """任务开始至今（或至结束）的秒数"""
+        if self.finished is not None:
+            return self.finished
+        return time.perf_counter() - self._origin
+
+    def to_chrome_trace(self):
+        """转换为 Chrome trace 格式（可在 chrome://tracing 或 Perfetto 中打开）"""
+        pid = os.getpid()
+        events = []
+        with self._lock:
+            spans = list(self.spans)
+            dropped = dict(self.dropped)
+        for s in spans:
+            events.append({
+                "name": s["name"],
+                "cat": self.job_name,
+                "ph": "X",
+                "ts": round(s["start"] * 1e6, 1),
+                "dur": round(s["dur"] * 1e6, 1),
+                "pid": pid,
+                "tid": s["tid"],
+                "args": s["attrs"],
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "job": self.job_name,
+                "started_at": self.started_at,
+                "total_seconds": round(self.elapsed(), 4),
+                # 超出 max_spans 后未逐条保存的 span 汇总
+                "dropped_spans": [
+                    {"name": name, "depth": depth, "count": count, "total": round(total, 4)}
+                    for (name, depth), (count, total, _) in dropped.items()
+                ],
+            },
+        }
+
+    def summary(self):
+        """生成一行耗时分解，仅统计顶层阶段，例如：总耗时 3.20s | xxapi.lookup×20 1.50s | llm.batch×1 1.20s"""
+        totals = {}  # name -> [次数, 总耗时]，按首次出现顺序
+        with self._lock:
+            spans = list(self.spans)
+            dropped = dict(self.dropped)
+        for s in sorted(spans, key=lambda item: item["start"]):
+            if s["depth"] != 0:
+                continue
+            entry = totals.setdefault(s["name"], [0, 0.0])
+            entry[0] += 1
+            entry[1] += s["dur"]
+        for (name, depth), (count, total, _) in dropped.items():
+            if depth == 0:
+                entry = totals.setdefault(name, [0, 0.0])
+                entry[0] += count
+                entry[1] += total
+
+        parts = [f"总耗时 {self.elapsed():.2f}s"]
+        for name, (count, total) in totals.items():
+            label = f"{name}×{count}" if count > 1 else name
+            parts.append(f"{label} {total:.2f}s")
+        return " | ".join(parts)
+
+
+class _NullSpan(dict):
+    """未启用追踪时返回的空 span，允许调用方照常设置属性"""
+
+
+def current_tracer():
+    """返回当前线程绑定的追踪器，没有则返回 None"""
+    return getattr(_local, "tracer", None)
+
+
+def activate(tracer):
+    """将追踪器绑定到当前线程（用于把任务的追踪延续到工作线程中）"""
+    _local.tracer = tracer
+    _local.stack = []
+
+
+def wrap(function):
+    """
+    包装函数，使其在其他线程（如线程池）中执行时沿用当前线程的追踪器。
+    工作线程中的 span 嵌套在调用 wrap 时所在的 span 之下（不会被当作顶层阶段重复计时），
+    执行结束后恢复工作线程原有的绑定。
+    """
+    tracer = current_tracer()
+    if tracer is None:
+        return function
+    parents = tuple(_local.stack)
+
+    def _wrapped(*args, **kwargs):
+        previous = current_tracer()
+        previous_stack = getattr(_local, "stack", [])
+        activate(tracer)
+        _local.stack = list(parents)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.tracer = previous
+            _local.stack = previous_stack
+
+    return _wrapped
+
+
+def start_job(job_name):
+    """开始一个新任务的追踪，并绑定到当前线程"""
+    tracer = Tracer(job_name)
+    activate(tracer)
+    return tracer
+
+
+def finish_job(tracer=None, trace_dir=None):
+    """
+    结束任务追踪并导出 Chrome trace 文件。
+
+    Returns:
+        tuple: (trace 文件路径或 None, 一行耗时分解)
+    """
+    tracer = tracer or current_tracer()
+    if tracer is None:
+        return None, ""
+
+    tracer.finished = time.perf_counter() - tracer._origin
+    if current_tracer() is tracer:
+        _local.tracer = None
+        _local.stack = []
+
+    summary = tracer.summary()
+    path = None
+    try:
+        trace_dir = trace_dir or TRACE_DIR
+        os.makedirs(trace_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(tracer.started_at))
+        path = os.path.join(trace_dir, f"{tracer.job_name}-{stamp}-{os.getpid()}-{id(tracer):x}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(tracer.to_chrome_trace(), f, ensure_ascii=False)
+    except Exception as e:
+        print(f"⚠️ 保存追踪文件失败：{e}")
+        path = None
+    return path, summary
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    记录一个阶段的耗时。
+
+    用法：
+        with span("xxapi.lookup", word=word) as s:
+            ...
+            s["result"] = "hit"
+
+    未启用追踪时几乎没有开销。
+    """
+    tracer = current_tracer()
+    if tracer is None:
+        yield _NullSpan(attrs)
+        return
+
+    stack = _local.stack
+    depth = len(stack)
+    stack.append(name)
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        end = time.perf_counter()
+        stack.pop()
+        tracer.record(name, start - tracer._origin, end - start, depth, attrs)
@@ -0,0 +1,214 @@
+# src/warm_cache.py
+"""
+释义缓存预热：提前把整学期的课本词表查询一遍并写入本地释义缓存，
+之后课堂上生成听写本时几乎所有单词都能直接从缓存取得。
+
+词表文件与 read_words_from_file 的格式相同（每行一个单词或短语）。
+查询走与正常生成相同的路径（小小API → 大模型），但对两者都限速，
+并关闭对冲，避免预热时占满接口额度。
+
+    python warm_cache.py 七年级上.txt 七年级下.txt --xxapi-rate 5 --llm-rate 20
+    python warm_cache.py 七年级上.txt --stats-only      # 只查看缓存覆盖率
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+from generateWord import read_words_from_file
+from meaning_cache import MeaningCache, cache_key
+from lookup_router import LookupRouter, RateLimiter
+from stream_pipeline import iter_chunks
+
+DEFAULT_XXAPI_RATE = 5.0   # 小小API每秒请求数
+DEFAULT_LLM_RATE = 20.0    # 大模型每分钟批次数
+DEFAULT_CHUNK_SIZE = 100   # 每次交给查询路由的单词数
+DEFAULT_XXAPI_WORKERS = 4
+
+
+def read_word_lists(files):
+    """读取多个词表，返回 ({文件: [单词]}, 去重后的单词列表)；按缓存键去重，保持首次出现的顺序"""
+    per_file = {}
+    unique = {}
+    for path in files:
+        words = read_words_from_file(path)
+        per_file[path] = words
+        for word in words:
+            unique.setdefault(cache_key(word), word)
+    return per_file, list(unique.values())
+
+
+def coverage(cache, words):
+    """返回 (已缓存的单词数, 单词总数)，按缓存键去重"""
+    keys = {cache_key(word): word for word in words}
+    return len(cache.get_many(keys.values())), len(keys)
+
+
+def file_coverage(cache, per_file, key):
+    """{文件: {"total": 总数, key: 已缓存数}}"""
+    result = {}
+    for path, words in per_file.items():
+        covered, total = coverage(cache, words)
+        result[path] = {"total": total, key: covered}
+    return result
+
+
+def build_warm_up_router(cache, xxapi_rate=DEFAULT_XXAPI_RATE, llm_rate=DEFAULT_LLM_RATE,
+                         xxapi_workers=DEFAULT_XXAPI_WORKERS):
+    """预热专用的查询路由：限速，且不发对冲请求（预热只关心吞吐，不关心单个单词的延迟）"""
+    return LookupRouter(
+        cache,
+        xxapi_workers=xxapi_workers,
+        llm_workers=1,
+        min_hedge_delay=float("inf"),
+        default_hedge_delay=float("inf"),
+        xxapi_limiter=RateLimiter(xxapi_rate, burst=xxapi_workers),
+        llm_limiter=RateLimiter(llm_rate / 60.0),
+    )
+
+
+def warm_cache(files, cache, router=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, stop=None):
+    """
+    查询词表中尚未缓存的单词并写入缓存。
+
+    Args:
+        files (list): 词表文件路径。
+        cache (MeaningCache): 要预热的缓存；router 为 None 时据此创建限速路由。
+        progress (callable, optional): progress(stats)，每处理完一块调用一次。
+        stop (threading.Event, optional): 置位后在当前块结束时停止。
+
+    Returns:
+        dict: 统计数据，包括预热前后的覆盖率、各状态和来源的单词数。
+    """
+    per_file, words = read_word_lists(files)
+    cached = cache.get_many(words)
+    missing = [word for word in words if word not in cached]
+    stats = {
+        "files": file_coverage(cache, per_file, "cached_before"),
+        "total": len(words),
+        "cached_before": len(cached),
+        "to_resolve": len(missing),
+        "processed": 0,
+        "statuses": {},
+        "sources": {},
+        "rate": 0.0,
+        "eta": None,
+        "stopped": False,
+    }
+
+    own_router = router is None
+    router = router or build_warm_up_router(cache)
+    start = time.perf_counter()
+    try:
+        for chunk in iter_chunks(missing, chunk_size):
+            if stop is not None and stop.is_set():
+                stats["stopped"] = True
+                break
+            store = router.resolve(chunk)
+            for name, count in store.counts().items():
+                stats["statuses"][name] = stats["statuses"].get(name, 0) + count
+            for name, count in store.source_counts().items():
+                stats["sources"][name] = stats["sources"].get(name, 0) + count
+            stats["processed"] += len(chunk)
+            elapsed = time.perf_counter() - start
+            stats["rate"] = stats["processed"] / elapsed if elapsed > 0 else 0.0
+            remaining = stats["to_resolve"] - stats["processed"]
+            stats["eta"] = remaining / stats["rate"] if stats["rate"] > 0 else None
+            if progress:
+                progress(stats)
+    finally:
+        if own_router:
+            router.close()
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["cached_after"] = coverage(cache, words)[0]
+    for path, file_words in per_file.items():
+        stats["files"][path]["cached_after"] = coverage(cache, file_words)[0]
+    return stats
+
+
+def warm_cache_in_background(files, cache, **kwargs):
+    """
+    在后台线程中预热，立即返回 (线程, 停止事件, 结果)。
+    结果是一个字典，线程结束后其中的 "stats" 或 "error" 有值。
+    """
+    stop = threading.Event()
+    result = {}
+
+    def run():
+        try:
+            result["stats"] = warm_cache(files, cache, stop=stop, **kwargs)
+        except Exception as e:
+            print(f"❌ 缓存预热失败：{e}")
+            result["error"] = e
+
+    thread = threading.Thread(target=run, name="cache-warm-up", daemon=True)
+    thread.start()
+    return thread, stop, result
+
+
+def _percent(part, total):
+    return f"{100.0 * part / total:.1f}%" if total else "-"
+
+
+def print_coverage(stats):
+    print("📊 缓存覆盖率：")
+    for path, data in stats["files"].items():
+        line = f"   {os.path.basename(path)}：{data['cached_before']}/{data['total']}（{_percent(data['cached_before'], data['total'])}）"
+        if "cached_after" in data:
+            line += f" → {data['cached_after']}/{data['total']}（{_percent(data['cached_after'], data['total'])}）"
+        print(line)
+    line = f"   合计：{stats['cached_before']}/{stats['total']}（{_percent(stats['cached_before'], stats['total'])}）"
+    if "cached_after" in stats:
+        line += f" → {stats['cached_after']}/{stats['total']}（{_percent(stats['cached_after'], stats['total'])}）"
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用课本词表预热本地释义缓存")
+    parser.add_argument("files", nargs="+", help="词表文件（每行一个单词或短语）")
+    parser.add_argument("--cache", default=None, help="缓存文件（默认使用 MEANING_CACHE_PATH 或 meaning_cache.sqlite3）")
+    parser.add_argument("--xxapi-rate", type=float, default=DEFAULT_XXAPI_RATE, help="小小API每秒最多请求数")
+    parser.add_argument("--llm-rate", type=float, default=DEFAULT_LLM_RATE, help="大模型每分钟最多批次数")
+    parser.add_argument("--xxapi-workers", type=int, default=DEFAULT_XXAPI_WORKERS, help="小小API并发数")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块单词数（进度按块报告）")
+    parser.add_argument("--stats-only", action="store_true", help="只报告缓存覆盖率，不查询")
+    args = parser.parse_args(argv)
+
+    cache = MeaningCache(args.cache) if args.cache else MeaningCache()
+    try:
+        if args.stats_only:
+            per_file, words = read_word_lists(args.files)
+            covered, total = coverage(cache, words)
+            print_coverage({"files": file_coverage(cache, per_file, "cached_before"),
+                            "total": total, "cached_before": covered})
+            return 0
+
+        def report(stats):
+            eta = f"，预计还需 {stats['eta'] / 60:.1f} 分钟" if stats["eta"] else ""
+            statuses = stats["statuses"]
+            print(f"📈 已处理 {stats['processed']}/{stats['to_resolve']}"
+                  f"（{_percent(stats['processed'], stats['to_resolve'])}）："
+                  f"新缓存 {statuses.get('resolved', 0)}，未找到 {statuses.get('not_found', 0)}，"
+                  f"失败 {statuses.get('failed', 0)}，{stats['rate']:.1f} 词/秒{eta}", flush=True)
+
+        router = build_warm_up_router(cache, args.xxapi_rate, args.llm_rate, args.xxapi_workers)
+        try:
+            stats = warm_cache(args.files, cache, router, args.chunk_size, report)
+        except KeyboardInterrupt:
+            # 已写入缓存的释义不会丢失，下次运行会从未缓存的单词继续
+            print("⏹️ 已中断，已查询到的释义均已写入缓存")
+            return 1
+        finally:
+            router.close()
+
+        print(f"✅ 预热完成，用时 {stats['seconds']:.1f}s，释义来源：{stats['sources'] or '-'}")
+        print_coverage(stats)
+        return 0
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+# src/watcher.py
+"""
+监视文件夹模式：扫描仪把图片写入共享目录后，自动识别并生成听写本。
+
+    python watcher.py /srv/scans --output-dir /srv/dictation --concurrency 4
+
+- Linux 下使用 inotify 监听文件写入完成事件，其他平台退回到定时扫描
+- 只处理 is_image_file 认可的图片（jpg/png），其他文件（如 PDF）会被跳过
+- 按文件内容的 SHA-256 去重，已处理过的内容不会重复调用接口
+- 默认把结果写到图片旁边的“<文件名（含扩展名）>-听写本”目录中
+"""
+import os
+import sys
+import json
+import time
+import errno
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import hashlib
+import argparse
+import threading
+
+from image_analyzer import is_image_file
+from jobs import Job, run_job, JOB_IMAGE, STATUS_DONE
+from metrics import start_from_env
+
+STATE_FILE_NAME = ".dictation-processed.jsonl"
+OUTPUT_SUFFIX = "-听写本"
+
+# inotify 事件常量（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """基于 inotify 的目录监听（仅 Linux）"""
+
+    def __init__(self, directory):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError(errno.ENOSYS, "当前平台不支持 inotify")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"无法监听目录 {directory}")
+        self.directory = directory
+
+    def events(self, timeout=1.0):
+        """
+        等待最多 timeout 秒，返回新写入完成的文件路径列表。
+        内核事件队列溢出时返回 None，调用方应重新扫描整个目录。
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name and not mask & IN_ISDIR:
+                paths.append(os.path.join(self.directory, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def file_signature(path):
+    """(大小, 修改时间)；文件已不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def stable_files(paths, interval):
+    """返回 interval 秒内大小和修改时间都没有变化的文件（与 PollingWatcher 判断写完的方式相同）"""
+    before = {path: file_signature(path) for path in paths}
+    time.sleep(interval)
+    return [path for path in paths if before[path] is not None and file_signature(path) == before[path]]
+
+
+class PollingWatcher:
+    """定时扫描目录；文件大小和修改时间在两次扫描间不变才认为已写完"""
+
+    def __init__(self, directory, interval=2.0):
+        self.directory = directory
+        self.interval = interval
+        self._pending = {}  # 路径 -> (大小, 修改时间)
+        self._seen = set()
+
+    def events(self, timeout=None):
+        time.sleep(self.interval)
+        ready = []
+        current = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                current[entry.path] = file_signature(entry.path)
+        for path, signature in current.items():
+            if path in self._seen:
+                continue
+            if self._pending.get(path) == signature:
+                ready.append(path)
+                self._seen.add(path)
+        self._pending = current
+        self._seen &= set(current)
+        return ready
+
+    def close(self):
+        pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ProcessedIndex:
+    """已处理内容的记录（JSON Lines，追加写入），按内容哈希去重"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.hashes = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.hashes[record["sha256"]] = record
+
+    def claim(self, sha256):
+        """若该内容尚未处理也未在处理中，则占用并返回 True"""
+        with self._lock:
+            if sha256 in self.hashes:
+                return False
+            self.hashes[sha256] = None  # 处理中
+            return True
+
+    def release(self, sha256):
+        """处理失败时释放，允许之后重试"""
+        with self._lock:
+            if self.hashes.get(sha256) is None:
+                self.hashes.pop(sha256, None)
+
+    def record(self, sha256, source, output_dir):
+        entry = {"sha256": sha256, "source": source, "output_dir": output_dir, "processed_at": time.time()}
+        with self._lock:
+            self.hashes[sha256] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class FolderDaemon:
+    """监听目录并以有限并发处理新图片"""
+
+    def __init__(self, watch_dir, output_dir=None, concurrency=4, poll=False, poll_interval=2.0):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        state_dir = self.output_dir or self.watch_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self.index = ProcessedIndex(os.path.join(state_dir, STATE_FILE_NAME))
+        # 有界队列：突发扫描时积压在这里（以及内核的 inotify 队列中），不会无限占用内存
+        self.queue = queue.Queue(maxsize=concurrency * 16)
+        self._stop = threading.Event()
+        self._workers = []
+        self.watcher = None
+        if not poll:
+            try:
+                self.watcher = InotifyWatcher(self.watch_dir)
+            except OSError as e:
+                print(f"⚠️ 无法使用 inotify（{e}），改为定时扫描")
+        if self.watcher is None:
+            self.watcher = PollingWatcher(self.watch_dir, poll_interval)
+
+    def output_dir_for(self, path):
+        # 保留扩展名：page.jpg 和 page.png 不会写到同一个目录
+        return os.path.join(self.output_dir or os.path.dirname(path), os.path.basename(path) + OUTPUT_SUFFIX)
+
+    def enqueue(self, path):
+        if is_image_file(path):
+            self.queue.put(path)  # 队列满时阻塞，形成背压
+
+    def scan_existing(self):
+        """
+        处理启动前（或 inotify 队列溢出期间）已经存在的文件。
+        仍在写入的文件先跳过，写完后由 IN_CLOSE_WRITE 事件（或下一次定时扫描）处理，避免处理不完整的文件。
+        """
+        paths = [entry.path for entry in sorted(os.scandir(self.watch_dir), key=lambda e: e.name)
+                 if entry.is_file() and is_image_file(entry.path)]
+        if not paths:
+            return
+        ready = stable_files(paths, self.poll_interval)
+        if len(ready) < len(paths):
+            print(f"⏳ {len(paths) - len(ready)} 个文件仍在写入，写完后再处理")
+        for path in ready:
+            self.enqueue(path)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                path = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.process(path)
+            except Exception as e:
+                print(f"❌ 处理 {path} 时出错：{e}")
+            finally:
+                self.queue.task_done()
+
+    def process(self, path):
+        """处理单个文件；内容已处理过时直接跳过"""
+        try:
+            sha256 = file_sha256(path)
+        except OSError as e:
+            print(f"⚠️ 无法读取 {path}：{e}")
+            return None
+        if not self.index.claim(sha256):
+            print(f"⏭️ 已处理过相同内容，跳过：{os.path.basename(path)}")
+            return None
+
+        output_dir = self.output_dir_for(path)
+        job = run_job(Job(JOB_IMAGE, path, output_dir))
+        if job.status == STATUS_DONE:
+            self.index.record(sha256, path, output_dir)
+            print(f"✅ {os.path.basename(path)} → {output_dir}（{job.trace_summary}）")
+        else:
+            self.index.release(sha256)
+            print(f"❌ {os.path.basename(path)} 处理失败：{job.message}")
+        return job
+
+    def run(self):
+        for _ in range(self.concurrency):
+            worker = threading.Thread(target=self._worker, name="watch-worker", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        print(f"👀 正在监视 {self.watch_dir}（{type(self.watcher).__name__}，并发 {self.concurrency}）")
+        self.scan_existing()
+        try:
+            while not self._stop.is_set():
+                paths = self.watcher.events(timeout=1.0)
+                if paths is None:
+                    print("⚠️ inotify 事件队列溢出，重新扫描目录")
+                    self.scan_existing()
+                    continue
+                for path in paths:
+                    self.enqueue(path)
+        finally:
+            self.watcher.close()
+
+    def stop(self, wait=True):
+        """
+        停止处理。wait 为 True 时先处理完队列中的所有文件，否则只等待进行中的任务完成；
+        排队中未处理的文件没有记录为已处理，下次启动时会重新扫描到。
+        """
+        if wait:
+            self.queue.join()
+        self._stop.set()
+        for worker in self._workers:
+            worker.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="监视目录，自动把新扫描的图片生成听写本")
+    parser.add_argument("directory", help="要监视的目录")
+    parser.add_argument("--output-dir", help="输出目录（默认写在图片旁边）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时处理的文件数")
+    parser.add_argument("--poll", action="store_true", help="不使用 inotify，改为定时扫描")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="定时扫描间隔（秒）")
+    args = parser.parse_args(argv)
+
+    start_from_env()
+    daemon = FolderDaemon(args.directory, args.output_dir, args.concurrency, args.poll, args.poll_interval)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print("⏹️ 正在停止，等待进行中的任务完成（排队中的文件下次启动时再处理）...")
+        daemon.stop(wait=False)
+        print("⏹️ 已停止")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
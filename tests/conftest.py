@@ -0,0 +1,9 @@
+# tests/conftest.py
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+# LLMAPI 在导入时检查 API Key；测试中不会真正调用接口
+os.environ.setdefault("ARK_API_KEY", "test")
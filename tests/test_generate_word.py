@@ -0,0 +1,62 @@
+# tests/test_generate_word.py
+"""小小API结果解析和听写本行渲染的单元测试"""
+import generateWord
+from generateWord import new_dictation_document, add_meaning_row, add_blank_row
+from entries import Entry, STATUS_RESOLVED, STATUS_NOT_FOUND, STATUS_FAILED
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+def test_empty_translations_count_as_not_found(monkeypatch):
+    monkeypatch.setattr(generateWord.requests, "get", lambda *args, **kwargs: FakeResponse(
+        {"code": 200, "data": {"translations": []}}))
+    assert generateWord.fetch_word_senses("empty") == (STATUS_NOT_FOUND, (), None)
+
+
+def test_translations_are_parsed(monkeypatch):
+    monkeypatch.setattr(generateWord.requests, "get", lambda *args, **kwargs: FakeResponse(
+        {"code": 200, "data": {"translations": [{"pos": "n", "tran_cn": " 苹果 "}]}}))
+    assert generateWord.fetch_word_senses("apple") == (STATUS_RESOLVED, (("n", "苹果"),), None)
+
+
+def test_rows_render_without_senses():
+    _, table = new_dictation_document()
+    entries = [
+        Entry("a", STATUS_RESOLVED, "xxapi", ()),
+        Entry("b", STATUS_NOT_FOUND),
+        Entry("c", STATUS_FAILED, error="超时"),
+        Entry("d", STATUS_RESOLVED, "xxapi", (("n", "测试"), ("v", "检验"))),
+    ]
+    for entry in entries:
+        add_meaning_row(table, entry)
+        add_blank_row(table, entry)
+
+    meanings = [row.cells[1].text for row in table.rows[-8::2]]
+    assert meanings == ["", "", "", "n. 测试\nv. 检验"]
+
+
+def test_generate_creates_missing_output_dir(tmp_path):
+    class StubRouter:
+        def resolve(self, words, progress=None, batch_progress=None, known=None):
+            from entries import EntryStore
+            store = EntryStore(words)
+            for word in store.pending_words():
+                store.resolve(word, (("n", "测试"),), "xxapi")
+            return store
+
+    word_file = tmp_path / "word.txt"
+    word_file.write_text("apple\npear\n", encoding='utf-8')
+    output_dir = tmp_path / "not" / "yet" / "created"
+    success, message = generateWord.generate_dictation_books(str(word_file), str(output_dir), router=StubRouter())
+    assert success, message
+    assert (output_dir / generateWord.MEANING_DOC_NAME).exists()
+    assert (output_dir / generateWord.BLANK_DOC_NAME).exists()
@@ -0,0 +1,268 @@
+# tests/test_lookup_router.py
+"""查询路由、熔断器和 EntryStore 的单元测试；小小API和大模型都用桩函数代替"""
+import time
+import threading
+
+import pytest
+
+import lookup_router
+from lookup_router import CircuitBreaker, LookupRouter
+from meaning_cache import MeaningCache
+from metrics import LLM_FALLBACK_WORDS
+from entries import STATUS_RESOLVED, STATUS_NOT_FOUND, STATUS_FAILED, SOURCE_XXAPI, SOURCE_LLM, SOURCE_VISION
+
+NOUN = (("n", "测试"),)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(lookup_router.time, "monotonic", fake)
+    return fake
+
+
+class Backends:
+    """记录调用的小小API / 大模型桩函数"""
+
+    def __init__(self, monkeypatch):
+        self.lock = threading.Lock()
+        self.xxapi_calls = []
+        self.llm_batches = []
+        self.xxapi = lambda word: (STATUS_RESOLVED, NOUN, None)
+        self.llm = lambda batch: {"translations": [{"word": word, "meaning": "n. 大模型"} for word in batch]}
+        monkeypatch.setattr(lookup_router, "fetch_word_senses", self._fetch_word_senses)
+        monkeypatch.setattr(lookup_router, "call_large_model_api", self._call_large_model_api)
+
+    def _fetch_word_senses(self, word):
+        with self.lock:
+            self.xxapi_calls.append(word)
+        return self.xxapi(word)
+
+    def _call_large_model_api(self, batch):
+        with self.lock:
+            self.llm_batches.append(list(batch))
+        return self.llm(batch)
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    return Backends(monkeypatch)
+
+
+@pytest.fixture
+def make_router():
+    routers = []
+
+    def make(cache=None, **kwargs):
+        kwargs.setdefault("batch_linger", 0.01)
+        router = LookupRouter(cache, **kwargs)
+        routers.append(router)
+        return router
+
+    yield make
+    for router in routers:
+        router.close()
+
+
+# --- 熔断器 ---
+def test_breaker_closed_open_half_open_closed(clock):
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=30.0)
+    assert breaker.allow() and not breaker.is_cooling_down()
+
+    breaker.record_failure()
+    assert not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open and breaker.is_cooling_down()
+    assert not breaker.allow()
+
+    clock.now += 30.0
+    assert not breaker.is_cooling_down()
+    assert not breaker.is_cooling_down()  # 只读检查不占用试探名额
+    assert breaker.allow()                # 半开：放行一个试探请求
+    assert not breaker.allow()
+    assert breaker.is_cooling_down()
+
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10.0)
+    breaker.record_failure()
+    clock.now += 10.0
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.is_open and breaker.is_cooling_down()
+    assert not breaker.allow()
+
+    clock.now += 10.0
+    assert breaker.allow()
+
+
+# --- 查询路由 ---
+def test_resolve_uses_xxapi_once_per_unique_word(backends, make_router):
+    store = make_router().resolve(["apple", "apple", "pear"])
+
+    assert sorted(backends.xxapi_calls) == ["apple", "pear"]
+    assert backends.llm_batches == []
+    assert len(store) == 2
+    assert store["apple"].status == STATUS_RESOLVED and store["apple"].source == SOURCE_XXAPI
+    assert store.counts() == {"resolved": 2}
+    assert store.source_counts() == {SOURCE_XXAPI: 2}
+
+
+def test_llm_after_xxapi_miss(backends, make_router):
+    backends.xxapi = lambda word: (STATUS_NOT_FOUND, (), None) if word == "rare" else (STATUS_RESOLVED, NOUN, None)
+    router = make_router()
+    fallbacks = LLM_FALLBACK_WORDS.get()
+    store = router.resolve(["rare", "common"])
+
+    assert LLM_FALLBACK_WORDS.get() - fallbacks == 1
+    assert backends.llm_batches == [["rare"]]
+    assert store["rare"].source == SOURCE_LLM and store["rare"].senses == (("n", "大模型"),)
+    assert store["common"].source == SOURCE_XXAPI
+    assert router.wins[SOURCE_LLM] == 1 and router.wins[SOURCE_XXAPI] == 1
+
+
+def test_hedged_llm_wins_over_slow_xxapi(backends, make_router):
+    release = threading.Event()
+
+    def slow_xxapi(word):
+        release.wait(5)
+        return (STATUS_RESOLVED, NOUN, None)
+
+    backends.xxapi = slow_xxapi
+    router = make_router(default_hedge_delay=0.05)
+    fallbacks = LLM_FALLBACK_WORDS.get()
+    try:
+        start = time.monotonic()
+        store = router.resolve(["slow"])
+        elapsed = time.monotonic() - start
+    finally:
+        release.set()
+
+    assert elapsed < 2
+    assert LLM_FALLBACK_WORDS.get() == fallbacks  # 对冲不算作小小API未命中
+    assert backends.llm_batches == [["slow"]]
+    assert store["slow"].source == SOURCE_LLM
+
+
+def test_in_flight_xxapi_requests_are_capped_per_resolve(backends, make_router):
+    active = peak = 0
+
+    def counting_xxapi(word):
+        nonlocal active, peak
+        with backends.lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.01)
+        with backends.lock:
+            active -= 1
+        return (STATUS_RESOLVED, NOUN, None)
+
+    backends.xxapi = counting_xxapi
+    store = make_router(xxapi_workers=8, max_in_flight=2).resolve([f"w{i}" for i in range(20)])
+
+    assert store.source_counts() == {SOURCE_XXAPI: 20}
+    assert peak == 2
+    assert backends.llm_batches == []
+
+
+def test_cache_writes_are_batched_per_resolve(backends, make_router, monkeypatch):
+    backends.xxapi = lambda word: (STATUS_NOT_FOUND, (), None) if word == "rare" else (STATUS_RESOLVED, NOUN, None)
+    cache = MeaningCache(":memory:")
+    writes = []
+    for name in ("put_many", "add_route_stats_many"):
+        original = getattr(cache, name)
+        monkeypatch.setattr(cache, name, lambda items, name=name, original=original: (writes.append(name), original(items)))
+    router = make_router(cache)
+    router.resolve(["a", "b", "rare"])
+
+    assert writes == ["put_many", "add_route_stats_many"]
+    assert set(cache.get_many(["a", "b", "rare"])) == {"a", "b", "rare"}
+    assert cache.load_route_stats() == {"word": [2, 1]}
+
+    backends.xxapi_calls.clear()
+    store = router.resolve(["a", "rare"])
+    assert backends.xxapi_calls == []
+    assert store.source_counts() == {"cache": 2}
+
+
+def test_predicted_miss_shapes_are_still_probed(backends, make_router):
+    backends.xxapi = lambda word: (STATUS_NOT_FOUND, (), None)
+    router = make_router(min_shape_samples=5, shape_probe_every=2, shape_stats_window=10)
+    router.resolve([f"a{i}" for i in range(10)])
+    assert router.predicted_miss("word")
+
+    # 小小API恢复收录：每两个预测未命中的单词仍有一个发给小小API，统计随之衰减
+    backends.xxapi = lambda word: (STATUS_RESOLVED, NOUN, None)
+    backends.xxapi_calls.clear()
+    store = router.resolve([f"b{i}" for i in range(10)])
+    assert len(backends.xxapi_calls) == 5
+    assert store.source_counts() == {SOURCE_XXAPI: 5, SOURCE_LLM: 5}
+    assert not router.predicted_miss("word")
+
+    backends.xxapi_calls.clear()
+    store = router.resolve(["c0", "c1"])
+    assert sorted(backends.xxapi_calls) == ["c0", "c1"]
+    assert store.source_counts() == {SOURCE_XXAPI: 2}
+
+
+def test_known_vision_meanings_are_used_but_not_cached(backends, make_router):
+    cache = MeaningCache(":memory:")
+    router = make_router(cache)
+    store = router.resolve(["seen", "other"], known={"seen": (("n", "视觉"),)})
+
+    assert backends.xxapi_calls == ["other"]
+    assert store["seen"].source == SOURCE_VISION
+    assert set(cache.get_many(["seen", "other"])) == {"other"}
+
+    store = router.resolve(["seen"])
+    assert backends.xxapi_calls == ["other", "seen"]
+    assert store["seen"].source == SOURCE_XXAPI
+
+
+def test_gives_up_when_both_backends_fail(backends, make_router):
+    backends.xxapi = lambda word: (STATUS_FAILED, (), "连接超时") if word == "down" else (STATUS_NOT_FOUND, (), None)
+    backends.llm = lambda batch: {"translations": []}
+    store = make_router().resolve(["down", "unknown"])
+
+    assert store["down"].status == STATUS_FAILED and store["down"].error == "连接超时"
+    assert store["unknown"].status == STATUS_NOT_FOUND
+    assert store.pending_count == 0
+
+
+def test_circuit_recovers_after_cooldown(backends, make_router):
+    healthy = False
+    backends.xxapi = lambda word: (STATUS_RESOLVED, NOUN, None) if healthy else (STATUS_FAILED, (), "503")
+    router = make_router(xxapi_workers=1, breaker=CircuitBreaker(failure_threshold=2, cooldown=0.1))
+
+    store = router.resolve(["a", "b"])
+    assert router.breaker.is_open
+    assert store.source_counts() == {SOURCE_LLM: 2}
+
+    # 冷却期内直接交给大模型
+    backends.xxapi_calls.clear()
+    router.resolve(["c"])
+    assert backends.xxapi_calls == []
+
+    # 冷却结束：路由器本身不占用试探名额，由工作线程发出试探请求并关闭熔断器
+    healthy = True
+    time.sleep(0.15)
+    store = router.resolve(["d"])
+    assert backends.xxapi_calls == ["d"]
+    assert store["d"].source == SOURCE_XXAPI
+    assert not router.breaker.is_open
+
+    store = router.resolve(["e", "f"])
+    assert store.source_counts() == {SOURCE_XXAPI: 2}
@@ -0,0 +1,22 @@
+# tests/test_metrics.py
+"""指标注册表的单元测试"""
+from metrics import Registry
+
+
+def test_histogram_quantile_interpolates_within_buckets():
+    registry = Registry()
+    histogram = registry.histogram("t_seconds", "测试", buckets=(0.1, 0.2, 0.5))
+    assert histogram.quantile(0.5) is None
+    for value in (0.05, 0.15, 0.15, 0.3):
+        histogram.observe(value)
+    assert abs(histogram.quantile(0.5) - 0.15) < 1e-9
+    assert 0.2 < histogram.quantile(0.95) <= 0.5
+
+
+def test_latency_quantile_gauges_are_exported():
+    from metrics import REGISTRY, LLM_LATENCY
+    LLM_LATENCY.observe(0.3)
+    lines = REGISTRY.render().splitlines()
+    assert any(line.startswith('call_latency_quantile_seconds{call="llm",quantile="0.5"}') and not line.endswith(" 0")
+               for line in lines)
+    assert any(line.startswith('call_latency_quantile_seconds{call="xxapi",quantile="0.95"}') for line in lines)
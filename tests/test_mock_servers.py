@@ -0,0 +1,67 @@
+# tests/test_mock_servers.py
+"""模拟服务录制 → 回放的往返测试"""
+import json
+import urllib.request
+
+import pytest
+
+import mock_servers
+from mock_servers import MockConfig
+
+
+def post_chat(base_url, text):
+    body = json.dumps({"model": "mock", "messages": [{"role": "user", "content": text}]}).encode('utf-8')
+    request = urllib.request.Request(f"{base_url}/chat/completions", data=body,
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def translations(payload):
+    reply = payload["choices"][0]["message"]["content"]
+    return {item["word"]: item["meaning"] for item in json.loads(mock_servers._strip_code_fence(reply))["translations"]}
+
+
+def batch_prompt(words):
+    return "请翻译。单词列表: " + ", ".join(f'"{word}"' for word in words)
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(mode, cassette=None, upstream=None):
+        server = mock_servers.MockServer(mock_servers.ArkHandler, MockConfig(), mode, cassette, upstream)
+        started.append(server)
+        return f"{server.base_url}/api/v3"
+
+    yield start
+    for server in started:
+        server.stop()
+
+
+def test_replay_answers_regrouped_batches_per_word(servers, tmp_path):
+    cassette = str(tmp_path / "ark.jsonl")
+    upstream = servers("mock").rsplit("/api/v3", 1)[0]
+    recorder = servers("record", cassette, upstream)
+
+    status, first = post_chat(recorder, batch_prompt(["apple", "pear"]))
+    assert status == 200
+    status, second = post_chat(recorder, batch_prompt(["plum", "take off"]))
+    assert status == 200
+    recorded = {**translations(first), **translations(second)}
+
+    replayer = servers("replay", cassette)
+    # 完全相同的请求按原始响应回放
+    status, payload = post_chat(replayer, batch_prompt(["apple", "pear"]))
+    assert status == 200 and payload == first
+    # 批次组成不同：逐词作答，没有录制的单词不出现在结果中
+    status, payload = post_chat(replayer, batch_prompt(["take off", "apple", "never recorded"]))
+    assert status == 200
+    assert translations(payload) == {"take off": recorded["take off"], "apple": recorded["apple"]}
+    # 一个单词都没有录制时仍返回 404
+    status, _ = post_chat(replayer, batch_prompt(["unknown"]))
+    assert status == 404
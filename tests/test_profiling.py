@@ -0,0 +1,21 @@
+# tests/test_profiling.py
+"""性能分析器的单元测试"""
+import time
+
+from profiling import Profiler
+
+MIB = 1024 * 1024
+
+
+def test_overlapping_profilers_keep_their_own_peak(tmp_path):
+    with Profiler(str(tmp_path / "outer"), name="outer", interval=0.002) as outer:
+        buffer = bytearray(20 * MIB)
+        time.sleep(0.05)
+        del buffer
+        # 另一个任务开始分析时，不应抹掉外层任务已经记录的峰值
+        with Profiler(str(tmp_path / "inner"), name="inner", interval=0.002) as inner:
+            time.sleep(0.05)
+
+    assert outer.peak >= 20 * MIB
+    assert inner.peak < 20 * MIB
+    assert "内存峰值" in (tmp_path / "outer" / "report.txt").read_text(encoding="utf-8")
@@ -0,0 +1,175 @@
+# tests/test_service.py
+"""HTTP 服务模式的请求解析、路由和 提交 → 查询 → 下载 往返测试"""
+import json
+import time
+import socket
+import asyncio
+import threading
+
+import pytest
+
+import lookup_router
+import service as service_module
+from lookup_router import LookupRouter
+from meaning_cache import MeaningCache
+from entries import STATUS_RESOLVED
+from service import DictationService, MAX_HEADER_BYTES, MAX_UPLOAD_BYTES
+
+
+class RunningService:
+    """在后台线程的事件循环中运行的服务"""
+
+    def __init__(self, jobs_dir, workers, queue_size):
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(jobs_dir, workers, queue_size), daemon=True)
+        self._thread.start()
+        assert self._ready.wait(10)
+
+    def _run(self, jobs_dir, workers, queue_size):
+        asyncio.set_event_loop(self.loop)
+
+        async def start():
+            self.service = DictationService(jobs_dir, workers, queue_size)
+            await self.service.start()
+            self.server = await asyncio.start_server(self.service.handle_connection, "127.0.0.1", 0,
+                                                     limit=MAX_HEADER_BYTES)
+            self.port = self.server.sockets[0].getsockname()[1]
+
+        self.loop.run_until_complete(start())
+        self._ready.set()
+        self.loop.run_forever()
+
+    def stop(self):
+        async def stop():
+            self.server.close()
+            await self.service.stop()
+
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(10)
+
+    def request(self, raw):
+        """发送原始请求，返回 (状态码, 响应头, 响应体)"""
+        with socket.create_connection(("127.0.0.1", self.port), timeout=10) as sock:
+            sock.sendall(raw)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        head, _, body = b"".join(chunks).partition(b"\r\n\r\n")
+        lines = head.decode('latin-1').split("\r\n")
+        headers = dict(line.split(": ", 1) for line in lines[1:])
+        return int(lines[0].split()[1]), headers, body
+
+    def get(self, path):
+        return self.request(f"GET {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode('latin-1'))
+
+    def post(self, path, body, headers=None):
+        headers = {"Content-Length": str(len(body)), **(headers or {})}
+        head = f"POST {path} HTTP/1.1\r\nHost: test\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        return self.request(head.encode('latin-1') + b"\r\n" + body)
+
+
+@pytest.fixture
+def start_service(tmp_path):
+    services = []
+
+    def start(workers=1, queue_size=4):
+        service = RunningService(str(tmp_path / "jobs"), workers, queue_size)
+        services.append(service)
+        return service
+
+    yield start
+    for service in services:
+        service.stop()
+
+
+@pytest.fixture
+def stub_router(monkeypatch):
+    monkeypatch.setattr(lookup_router, "fetch_word_senses", lambda word: (STATUS_RESOLVED, (("n", f"{word}的释义"),), None))
+    monkeypatch.setattr(lookup_router, "call_large_model_api", lambda batch: {"translations": []})
+    router = LookupRouter(MeaningCache(":memory:"))
+    monkeypatch.setattr(lookup_router, "_default_router", router)
+    yield router
+    router.close()
+
+
+@pytest.mark.parametrize("length", ["abc", "-1", "1.5"])
+def test_invalid_content_length_is_400(start_service, length):
+    status, _, body = start_service().post("/jobs?type=words", b"apple", {"Content-Length": length})
+    assert status == 400
+    assert "Content-Length" in json.loads(body)["error"]
+
+
+def test_post_without_content_length_is_411(start_service):
+    status, _, _ = start_service().request(b"POST /jobs HTTP/1.1\r\nHost: test\r\n\r\n")
+    assert status == 411
+
+
+def test_upload_too_large_is_413(start_service):
+    service = start_service()
+    status, _, _ = service.post("/jobs?type=words", b"", {"Content-Length": str(MAX_UPLOAD_BYTES + 1)})
+    assert status == 413
+
+
+def test_bad_request_line_and_parameters_are_400(start_service):
+    service = start_service()
+    assert service.request(b"NONSENSE\r\n\r\n")[0] == 400
+    assert service.post("/jobs?type=pdf", b"apple")[0] == 400
+    assert service.post("/jobs?type=words", b"  \n ")[0] == 400
+    assert service.post("/jobs?type=image&filename=scan.pdf", b"%PDF")[0] == 400
+
+
+def test_unknown_paths_and_jobs_are_404(start_service):
+    service = start_service()
+    assert service.get("/nothing")[0] == 404
+    assert service.get("/jobs/does-not-exist")[0] == 404
+    assert service.request(b"DELETE /jobs HTTP/1.1\r\nHost: test\r\n\r\n")[0] == 405
+
+
+def test_full_queue_is_503(start_service, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def blocked_run_job(job):
+        started.set()
+        release.wait(10)
+        return job
+
+    monkeypatch.setattr(service_module, "run_job", blocked_run_job)
+    service = start_service(workers=1, queue_size=1)
+    try:
+        assert service.post("/jobs?type=words", b"apple")[0] == 202   # 由唯一的工作线程执行（阻塞）
+        assert started.wait(10)
+        assert service.post("/jobs?type=words", b"pear")[0] == 202    # 排队
+        status, headers, _ = service.post("/jobs?type=words", b"plum")
+        assert status == 503
+        assert headers.get("Retry-After") == "10"
+    finally:
+        release.set()
+
+
+def test_submit_poll_download_round_trip(start_service, stub_router):
+    service = start_service()
+    status, headers, body = service.post("/jobs?type=words", "apple\ntake off\n".encode('utf-8'))
+    assert status == 202
+    location = headers["Location"]
+    assert json.loads(body)["status"] in ("queued", "running", "done")
+
+    deadline = time.monotonic() + 30
+    while True:
+        status, _, body = service.get(location)
+        data = json.loads(body)
+        if data["status"] in ("done", "failed") or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert data["status"] == "done", data["message"]
+    assert len(data["downloads"]) == 2
+
+    status, headers, payload = service.get(data["downloads"][0])
+    assert status == 200
+    assert headers["Content-Type"].endswith("wordprocessingml.document")
+    assert payload.startswith(b"PK")  # .docx 是 zip 文件
+    assert service.get(location + "/files/other.docx")[0] == 404
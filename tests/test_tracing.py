@@ -0,0 +1,24 @@
+# tests/test_tracing.py
+"""追踪记录器的单元测试"""
+from tracing import Tracer, activate, span, current_tracer
+
+
+def test_spans_beyond_limit_are_aggregated():
+    tracer = Tracer("job", max_spans=3)
+    previous = current_tracer()
+    activate(tracer)
+    try:
+        with span("stage"):
+            for _ in range(5):
+                with span("lookup"):
+                    pass
+    finally:
+        activate(previous)
+
+    assert [s["name"] for s in tracer.spans] == ["lookup"] * 3
+    assert set(tracer.dropped) == {("lookup", 1), ("stage", 0)}
+    assert tracer.dropped[("lookup", 1)][0] == 2
+    assert "stage " in tracer.summary()
+
+    other = tracer.to_chrome_trace()["otherData"]
+    assert {(d["name"], d["count"]) for d in other["dropped_spans"]} == {("lookup", 2), ("stage", 1)}
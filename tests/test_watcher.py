@@ -0,0 +1,42 @@
+# tests/test_watcher.py
+"""监视文件夹模式的启动扫描和输出目录命名"""
+import os
+
+import watcher
+from watcher import FolderDaemon
+
+
+def queued(daemon):
+    items = []
+    while not daemon.queue.empty():
+        items.append(os.path.basename(daemon.queue.get_nowait()))
+    return items
+
+
+def test_output_dirs_keep_the_extension(tmp_path):
+    daemon = FolderDaemon(str(tmp_path), poll=True)
+    jpg = daemon.output_dir_for(str(tmp_path / "page.jpg"))
+    png = daemon.output_dir_for(str(tmp_path / "page.png"))
+    assert jpg != png
+    assert os.path.dirname(jpg) == str(tmp_path)
+
+
+def test_scan_existing_skips_files_still_being_written(tmp_path, monkeypatch):
+    (tmp_path / "done.jpg").write_bytes(b"finished scan")
+    (tmp_path / "notes.pdf").write_bytes(b"%PDF")
+    growing = tmp_path / "growing.png"
+    growing.write_bytes(b"partial")
+
+    def sleep_while_scanner_writes(seconds):
+        with open(growing, 'ab') as f:
+            f.write(b" more data")
+
+    monkeypatch.setattr(watcher.time, "sleep", sleep_while_scanner_writes)
+    daemon = FolderDaemon(str(tmp_path), poll=True)
+    daemon.scan_existing()
+    assert queued(daemon) == ["done.jpg"]
+
+    # 写完之后再次扫描（例如 inotify 队列溢出后）会处理它
+    monkeypatch.setattr(watcher.time, "sleep", lambda seconds: None)
+    daemon.scan_existing()
+    assert queued(daemon) == ["done.jpg", "growing.png"]